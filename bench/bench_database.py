@@ -0,0 +1,114 @@
+"""Per-call latency of the hot-path queries: connect-per-call vs DatabaseManager's persistent connections.
+
+Run from the project root:
+
+    python bench/bench_database.py [--calls 2000]
+
+"before" reproduces the original get_connection (a fresh sqlite3 connection,
+default journal mode, for every call). "after" goes through DatabaseManager:
+the blocked check as a read on the persistent WAL reader connection and
+the message insert as a commit on the persistent writer connection. The
+bot itself now answers the blocked check from memory and batches message
+inserts (save_message), so these isolate what the connection change saves.
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+WORK_DIR = tempfile.mkdtemp(prefix='anonymous-bot-bench-')
+# The module-level db_manager is created on import; keep it off the real database
+os.environ['DATABASE_PATH'] = os.path.join(WORK_DIR, 'unused.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager  # noqa: E402
+
+USERS = 1000
+
+def report(name: str, samples: list):
+    samples = sorted(samples)
+    median = statistics.median(samples) * 1e6
+    p99 = samples[int(len(samples) * 0.99) - 1] * 1e6
+    print(f"{name:<32} median {median:9.1f} us   p99 {p99:9.1f} us")
+
+def bench_connect_per_call(db_path: str, calls: int):
+    def is_user_blocked(user_id):
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute('SELECT is_blocked FROM users WHERE user_id = ?', (user_id,)).fetchone()
+            return bool(row['is_blocked']) if row else False
+        finally:
+            conn.close()
+
+    def save_message(user_id, message):
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.execute('INSERT INTO messages (user_id, message, timestamp) VALUES (?, ?, ?)',
+                         (user_id, message, datetime.now().isoformat()))
+            conn.commit()
+        finally:
+            conn.close()
+
+    for name, call in (('before: is_user_blocked', lambda i: is_user_blocked(i % USERS)),
+                       ('before: save_message', lambda i: save_message(i % USERS, f'message {i}'))):
+        samples = []
+        for i in range(calls):
+            start = time.perf_counter()
+            call(i)
+            samples.append(time.perf_counter() - start)
+        report(name, samples)
+
+async def bench_persistent(db_path: str, calls: int):
+    db = DatabaseManager(db_path)
+
+    def is_user_blocked(conn, user_id):
+        row = conn.execute('SELECT is_blocked FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        return bool(row['is_blocked']) if row else False
+
+    def save_message(conn, user_id, message):
+        conn.execute('INSERT INTO messages (user_id, message, timestamp) VALUES (?, ?, ?)',
+                     (user_id, message, datetime.now().isoformat()))
+
+    for name, call in (('after: is_user_blocked', lambda i: db._read(is_user_blocked, i % USERS)),
+                       ('after: save_message', lambda i: db._write(save_message, i % USERS, f'message {i}'))):
+        samples = []
+        for i in range(calls):
+            start = time.perf_counter()
+            await call(i)
+            samples.append(time.perf_counter() - start)
+        report(name, samples)
+    await db.close()
+
+def prepare(db_path: str):
+    """A migrated database with USERS users, the same file for both runs"""
+    async def create():
+        db = DatabaseManager(db_path)
+        for user_id in range(USERS):
+            await db.add_user(user_id, f'user{user_id}')
+        await db.close()
+
+    asyncio.run(create())
+    # Start "before" from the journal mode the original code used
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    db_path = os.path.join(WORK_DIR, 'bench.db')
+    prepare(db_path)
+    print(f"{args.calls} calls per operation, database in {WORK_DIR}")
+    bench_connect_per_call(db_path, args.calls)
+    asyncio.run(bench_persistent(db_path, args.calls))
+
+if __name__ == '__main__':
+    main()
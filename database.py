@@ -1,343 +1,917 @@
+import asyncio
 import sqlite3
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from contextlib import asynccontextmanager
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Callable, Any, AsyncIterator, Dict
 from datetime import datetime
+from migrations import run_migrations, recount_stats
+from cache import LRUCache
 
 # Load environment variables
 load_dotenv()
 OWNER_USER_ID = int(os.getenv('OWNER_USER_ID', 0))
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'anonymous_bot.db')
 
 logger = logging.getLogger(__name__)
 
+# SQLite tuning for the long-lived connections
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 20000))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_STATEMENT_CACHE = 256
+
+# Number of user profiles (username, first and last name) kept in memory
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 10000))
+
+# Number of read-only connections serving queries in parallel with the writer
+DB_READER_THREADS = int(os.getenv('DB_READER_THREADS', 4))
+
+# Message archive group commit: flush every N milliseconds or M rows, whichever comes first
+MESSAGE_FLUSH_INTERVAL_MS = int(os.getenv('MESSAGE_FLUSH_INTERVAL_MS', 50))
+MESSAGE_FLUSH_BATCH_SIZE = int(os.getenv('MESSAGE_FLUSH_BATCH_SIZE', 500))
+MESSAGE_QUEUE_SIZE = int(os.getenv('MESSAGE_QUEUE_SIZE', 10000))
+# Crash safety: when enabled, save_message always waits until its row is committed
+MESSAGE_DURABLE_WRITES = os.getenv('MESSAGE_DURABLE_WRITES', 'false').lower() in ('1', 'true', 'yes')
+
+# Messages indexed per background batch when building the search index for existing rows
+SEARCH_BACKFILL_BATCH = int(os.getenv('SEARCH_BACKFILL_BATCH', 5000))
+SEARCH_BACKFILL_PAUSE = 0.2
+
+class MessageWriter:
+    """Write-behind buffer that group-commits message inserts.
+
+    Rows are collected on a bounded queue (callers wait when it is full) and
+    written with a single executemany transaction on the database writer
+    thread. Without durable writes, a crash can lose rows that are still
+    buffered (at most one flush interval or a full queue).
+    """
+
+    def __init__(self, db: 'DatabaseManager', flush_interval_ms: int = MESSAGE_FLUSH_INTERVAL_MS,
+                 batch_size: int = MESSAGE_FLUSH_BATCH_SIZE, queue_size: int = MESSAGE_QUEUE_SIZE):
+        self._db = db
+        self._flush_interval = flush_interval_ms / 1000
+        self._batch_size = batch_size
+        self._queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_started(self):
+        """Create the queue and flush task inside the running event loop"""
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self._queue_size)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def put(self, row: tuple, want_ack: bool = False) -> Optional[asyncio.Future]:
+        """Queue a (user_id, message, timestamp) row; returns a commit ack future if requested"""
+        self._ensure_started()
+        ack = asyncio.get_running_loop().create_future() if want_ack else None
+        await self._queue.put((row, ack))
+        return ack
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            deadline = loop.time() + self._flush_interval
+            while len(batch) < self._batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: list):
+        """Insert a batch in one transaction and resolve any waiting acks"""
+        def _insert_messages(conn, rows):
+            conn.executemany('''
+                INSERT INTO messages (user_id, message, timestamp)
+                VALUES (?, ?, ?)
+            ''', rows)
+
+        try:
+            await self._db._write(_insert_messages, [row for row, _ in batch])
+            ok = True
+        except Exception as e:
+            logger.error(f"Error flushing {len(batch)} buffered messages: {e}")
+            ok = False
+        for _, ack in batch:
+            if ack is not None and not ack.done():
+                ack.set_result(ok)
+
+    async def close(self):
+        """Flush everything still queued and stop the flush task"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._queue = None
+
 class DatabaseManager:
-    def __init__(self, db_path: str = 'anonymous_bot.db'):
+    """SQLite access layer.
+
+    All blocking sqlite3 work runs off the event loop: writes are queued on a
+    single writer thread (SQLite only allows one writer at a time) and reads
+    run on a small pool of query_only connections, which WAL mode lets proceed
+    concurrently with the writer.
+    """
+
+    def __init__(self, db_path: str = DATABASE_PATH, reader_threads: int = DB_READER_THREADS):
         self.db_path = db_path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._readers = ThreadPoolExecutor(max_workers=reader_threads, thread_name_prefix='db-reader')
+        self.message_writer = MessageWriter(self)
+        self._unreachable_ids = set()
+        self._blocked_ids = set()
+        self._profiles = LRUCache(PROFILE_CACHE_SIZE)
+        # Profiles known to match the users table; lets add_user skip unchanged rows
+        self._stored_profiles = LRUCache(PROFILE_CACHE_SIZE)
+        self._search_backfill_task: Optional[asyncio.Task] = None
         self.init_db()
-    
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        """Open a tuned connection (WAL, relaxed fsync, large page cache, mmap)"""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=SQLITE_STATEMENT_CACHE
+        )
+        conn.row_factory = sqlite3.Row  # For easier column access
+        if not read_only:
+            # Takes effect only on a new database (before WAL mode and the first table);
+            # lets retention hand freed pages back to the file system
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA busy_timeout = 5000')
+        if read_only:
+            conn.execute('PRAGMA query_only = ON')
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _thread_connection(self, read_only: bool) -> sqlite3.Connection:
+        """Connection owned by the current executor thread, opened on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect(read_only)
+        return conn
+
+    def _call(self, read_only: bool, fn: Callable[..., Any], args: tuple) -> Any:
+        """Run fn(conn, *args) on the current thread's connection"""
+        conn = self._thread_connection(read_only)
+        if read_only:
+            return fn(conn, *args)
+        with conn:  # Commit on success, roll back on error
+            return fn(conn, *args)
+
+    async def _read(self, fn: Callable[..., Any], *args) -> Any:
+        """Run a query on the reader pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._call, True, fn, args)
+
+    async def _write(self, fn: Callable[..., Any], *args) -> Any:
+        """Queue a write transaction on the writer thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self._call, False, fn, args)
+
     def init_db(self):
-        """Initialize database tables"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Users table
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        user_id INTEGER PRIMARY KEY,
-                        username TEXT,
-                        first_name TEXT,
-                        last_name TEXT,
-                        join_date TEXT,
-                        is_blocked INTEGER DEFAULT 0
-                    )
-                ''')
-                
-                # Messages table
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS messages (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        message TEXT,
-                        timestamp TEXT,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id)
-                    )
-                ''')
-                
-                conn.commit()
-                logger.info("Database initialized successfully")
+        """Bring the schema up to date by running pending migrations"""
+        try:
+            version = self._writer.submit(self._call, False, run_migrations, ()).result()
+            self._unreachable_ids = self._readers.submit(self._call, True, self._load_unreachable_ids, ()).result()
+            self._blocked_ids = self._readers.submit(self._call, True, self._load_blocked_ids, ()).result()
+            logger.info(f"Database initialized successfully (schema version {version})")
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
             raise
-    
-    @asynccontextmanager
-    async def get_connection(self):
-        """Context manager for database connections"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row  # For easier column access
-            yield conn
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            logger.error(f"Database error: {e}")
-            raise
-        finally:
-            if conn:
+
+    @staticmethod
+    def _load_unreachable_ids(conn) -> set:
+        cursor = conn.execute("SELECT user_id FROM users WHERE delivery_status != 'ok'")
+        return {row['user_id'] for row in cursor.fetchall()}
+
+    @staticmethod
+    def _load_blocked_ids(conn) -> set:
+        cursor = conn.execute('SELECT user_id FROM users WHERE is_blocked = 1')
+        return {row['user_id'] for row in cursor.fetchall()}
+
+    async def close(self):
+        """Drain pending work and close all connections (called on application shutdown)"""
+        if self._search_backfill_task is not None:
+            self._search_backfill_task.cancel()
+            await asyncio.gather(self._search_backfill_task, return_exceptions=True)
+            self._search_backfill_task = None
+        await self.message_writer.close()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._writer.shutdown)
+        await loop.run_in_executor(None, self._readers.shutdown)
+        with self._connections_lock:
+            for conn in self._connections:
                 conn.close()
-    
-    async def add_user(self, user_id: int, username: Optional[str] = None, 
+            self._connections.clear()
+        logger.info("Database connections closed")
+
+    async def add_user(self, user_id: int, username: Optional[str] = None,
                       first_name: Optional[str] = None, last_name: Optional[str] = None) -> bool:
-        """Add or update user in database"""
-        try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR REPLACE INTO users 
-                    (user_id, username, first_name, last_name, join_date, is_blocked)
-                    VALUES (?, ?, ?, ?, ?, 
-                           COALESCE((SELECT is_blocked FROM users WHERE user_id = ?), 0))
-                ''', (user_id, username, first_name, last_name, 
-                     datetime.now().isoformat(), user_id))
-                conn.commit()
-                return True
+        """Add user, or update their profile if it changed (join_date is kept)"""
+        profile = (username, first_name, last_name)
+        if self._stored_profiles.get(user_id) == profile:
+            # Already stored exactly like this: nothing to write
+            self._profiles.set(user_id, profile)
+            return True
+
+        def _add_user(conn):
+            # The WHERE clause turns an unchanged profile into a no-op
+            conn.execute('''
+                INSERT INTO users (user_id, username, first_name, last_name, join_date)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name
+                WHERE users.username IS NOT excluded.username
+                   OR users.first_name IS NOT excluded.first_name
+                   OR users.last_name IS NOT excluded.last_name
+            ''', (user_id, username, first_name, last_name, datetime.now().isoformat()))
+
+        self._profiles.pop(user_id)
+        self._stored_profiles.pop(user_id)
+        try:
+            await self._write(_add_user)
+            self._profiles.set(user_id, profile)
+            self._stored_profiles.set(user_id, profile)
+            return True
         except Exception as e:
             logger.error(f"Error adding user {user_id}: {e}")
             return False
-    
+
+    def remember_user(self, user_id: int, username: Optional[str] = None,
+                      first_name: Optional[str] = None, last_name: Optional[str] = None):
+        """Cache profile data seen on an incoming update (no database write)"""
+        self._profiles.set(user_id, (username, first_name, last_name))
+
     async def get_user_info(self, user_id: int) -> Tuple[Optional[str], Optional[str], Optional[str]]:
-        """Get user information"""
+        """Get user information (served from the profile cache when possible)"""
+        profile = self._profiles.get(user_id)
+        if profile is not None:
+            return profile
+
+        def _get_user_info(conn):
+            result = conn.execute(
+                'SELECT username, first_name, last_name FROM users WHERE user_id = ?', (user_id,)
+            ).fetchone()
+            if result:
+                return result['username'], result['first_name'], result['last_name']
+            return None, None, None
+
         try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT username, first_name, last_name FROM users WHERE user_id = ?', (user_id,))
-                result = cursor.fetchone()
-                if result:
-                    return result['username'], result['first_name'], result['last_name']
-                return None, None, None
+            profile = await self._read(_get_user_info)
+            if profile != (None, None, None):
+                self._profiles.set(user_id, profile)
+                self._stored_profiles.set(user_id, profile)
+            return profile
         except Exception as e:
             logger.error(f"Error getting user info for {user_id}: {e}")
             return None, None, None
-    
+
     async def find_user_by_username(self, username: str) -> Optional[int]:
         """Find user by username"""
+        def _find_user(conn):
+            result = conn.execute('SELECT user_id FROM users WHERE username = ?', (username,)).fetchone()
+            return result['user_id'] if result else None
+
         try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT user_id FROM users WHERE username = ?', (username,))
-                result = cursor.fetchone()
-                return result['user_id'] if result else None
+            return await self._read(_find_user)
         except Exception as e:
             logger.error(f"Error finding user by username {username}: {e}")
             return None
-    
+
     async def get_user_by_username(self, username: str):
         """Get user by username"""
+        def _get_user(conn):
+            return conn.execute('SELECT user_id FROM users WHERE username = ?', (username,)).fetchone()
+
         try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT user_id FROM users WHERE username = ?', (username,))
-                result = cursor.fetchone()
-                return result if result else None
+            return await self._read(_get_user)
         except Exception as e:
             logger.error(f"Error getting user by username {username}: {e}")
             return None
-    
-    async def save_message(self, user_id: int, message: str) -> bool:
-        """Save message to database"""
-        try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO messages (user_id, message, timestamp)
-                    VALUES (?, ?, ?)
-                ''', (user_id, message, datetime.now().isoformat()))
-                conn.commit()
-                return True
+
+    async def save_message(self, user_id: int, message: str, wait: bool = False) -> bool:
+        """Queue message for the archive; with wait=True, return once it is committed"""
+        wait = wait or MESSAGE_DURABLE_WRITES
+        try:
+            ack = await self.message_writer.put((user_id, message, datetime.now().isoformat()), want_ack=wait)
+            if ack is not None:
+                return await ack
+            return True
         except Exception as e:
             logger.error(f"Error saving message for user {user_id}: {e}")
             return False
-    
+
+    async def get_user_messages(self, user_id: int, before_id: int = 0, limit: int = 10) -> List[dict]:
+        """A user's messages, newest first, older than before_id (0 = from the newest); keyset paged"""
+        def _get_messages(conn):
+            cursor = conn.execute('''
+                SELECT id, message, timestamp FROM messages
+                WHERE user_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (user_id, before_id or (1 << 63) - 1, limit))
+            return [dict(row) for row in cursor.fetchall()]
+
+        try:
+            return await self._read(_get_messages)
+        except Exception as e:
+            logger.error(f"Error getting messages of user {user_id}: {e}")
+            return []
+
     async def get_all_users(self):
         """Get list of all users (excluding admin)"""
+        def _get_all_users(conn):
+            cursor = conn.execute('''
+                SELECT user_id, username, first_name, last_name, join_date, is_blocked
+                FROM users WHERE user_id != ? ORDER BY join_date DESC
+            ''', (OWNER_USER_ID,))
+            return [(row['user_id'], row['username'], row['first_name'],
+                    row['last_name'], row['join_date'], row['is_blocked'])
+                   for row in cursor.fetchall()]
+
         try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT user_id, username, first_name, last_name, join_date, is_blocked 
-                    FROM users WHERE user_id != ? ORDER BY join_date DESC
-                ''', (OWNER_USER_ID,))
-                return [(row['user_id'], row['username'], row['first_name'], 
-                        row['last_name'], row['join_date'], row['is_blocked']) 
-                       for row in cursor.fetchall()]
+            return await self._read(_get_all_users)
         except Exception as e:
             logger.error(f"Error getting all users: {e}")
             return []
-        
+
+    async def get_users_page(self, blocked_only: bool = False, after_user_id: Optional[int] = None,
+                             before_user_id: Optional[int] = None, from_end: bool = False,
+                             limit: int = 20) -> List[Tuple[int, str, str, str, str, int]]:
+        """One page of users, newest first, keyset-paged on (join_date, user_id).
+
+        after_user_id: the page following that user; before_user_id: the page
+        preceding that user; from_end: the oldest page. Each page costs one
+        index range scan of `limit` rows, however deep it is.
+        """
+        def _get_page(conn):
+            conditions = ['user_id != ?']
+            params = [OWNER_USER_ID]
+            if blocked_only:
+                conditions.append('is_blocked = 1')
+            # The cursor row's join_date is looked up by primary key, so callback data only carries an ID
+            if after_user_id is not None:
+                conditions.append('(join_date, user_id) < ((SELECT join_date FROM users WHERE user_id = ?), ?)')
+                params += [after_user_id, after_user_id]
+            elif before_user_id is not None:
+                conditions.append('(join_date, user_id) > ((SELECT join_date FROM users WHERE user_id = ?), ?)')
+                params += [before_user_id, before_user_id]
+            ascending = before_user_id is not None or (from_end and after_user_id is None)
+            order = 'ASC' if ascending else 'DESC'
+            cursor = conn.execute(f'''
+                SELECT user_id, username, first_name, last_name, join_date, is_blocked
+                FROM users WHERE {' AND '.join(conditions)}
+                ORDER BY join_date {order}, user_id {order}
+                LIMIT ?
+            ''', (*params, limit))
+            rows = [(row['user_id'], row['username'], row['first_name'],
+                     row['last_name'], row['join_date'], row['is_blocked'])
+                    for row in cursor.fetchall()]
+            return rows[::-1] if ascending else rows
+
+        try:
+            return await self._read(_get_page)
+        except Exception as e:
+            logger.error(f"Error getting users page: {e}")
+            return []
+
+    async def get_user_totals(self) -> dict:
+        """Maintained user/blocked totals (no table scan), for page counts"""
+        try:
+            return await self._read(self._read_counters)
+        except Exception as e:
+            logger.error(f"Error getting user totals: {e}")
+            return {'total_users': 0, 'blocked_users': 0}
+
+    @staticmethod
+    def _read_counters(conn) -> dict:
+        """Read the maintained counters in one statement, excluding the admin's own row"""
+        row = conn.execute('''
+            SELECT total_users, blocked_users, unreachable_users, total_messages, archived_messages,
+                   (SELECT COUNT(*) FROM users WHERE user_id = ?) as owner_rows,
+                   (SELECT COUNT(*) FROM users WHERE user_id = ? AND is_blocked = 1) as owner_blocked,
+                   (SELECT COUNT(*) FROM users WHERE user_id = ? AND is_blocked = 0
+                    AND delivery_status != 'ok') as owner_unreachable
+            FROM stats_counters WHERE id = 1
+        ''', (OWNER_USER_ID, OWNER_USER_ID, OWNER_USER_ID)).fetchone()
+        total_users = row['total_users'] - row['owner_rows']
+        blocked_users = row['blocked_users'] - row['owner_blocked']
+        unreachable_users = row['unreachable_users'] - row['owner_unreachable']
+        return {
+            'total_users': total_users,
+            'active_users': total_users - blocked_users - unreachable_users,
+            'blocked_users': blocked_users,
+            'unreachable_users': unreachable_users,
+            'total_messages': row['total_messages'] + row['archived_messages']
+        }
+
     async def get_system_stats(self):
         """Get system statistics (excluding admin)"""
+        def _get_system_stats(conn):
+            counters = self._read_counters(conn)
+            
+            # Total messages including archived ones (excluding admin messages still in the database)
+            owner_messages = conn.execute(
+                'SELECT COUNT(*) as count FROM messages WHERE user_id = ?', (OWNER_USER_ID,)
+            ).fetchone()['count']
+            total_messages = counters['total_messages'] - owner_messages
+            
+            return (counters['total_users'], counters['active_users'],
+                    counters['blocked_users'], total_messages)
+
         try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Total users (excluding admin)
-                cursor.execute('SELECT COUNT(*) as count FROM users WHERE user_id != ?', (OWNER_USER_ID,))
-                total_users = cursor.fetchone()['count']
-                
-                # Active users (not blocked and excluding admin)
-                cursor.execute('SELECT COUNT(*) as count FROM users WHERE is_blocked = 0 AND user_id != ?', (OWNER_USER_ID,))
-                active_users = cursor.fetchone()['count']
-                
-                # Blocked users (excluding admin)
-                cursor.execute('SELECT COUNT(*) as count FROM users WHERE is_blocked = 1 AND user_id != ?', (OWNER_USER_ID,))
-                blocked_users = cursor.fetchone()['count']
-                
-                # Total messages (excluding admin messages)
-                cursor.execute('SELECT COUNT(*) as count FROM messages WHERE user_id != ?', (OWNER_USER_ID,))
-                total_messages = cursor.fetchone()['count']
-                
-                return total_users, active_users, blocked_users, total_messages
+            return await self._read(_get_system_stats)
         except Exception as e:
             logger.error(f"Error getting system stats: {e}")
             return 0, 0, 0, 0
-        
+
     async def get_active_users(self):
-        """Get list of active users (excluding admin)"""
+        """Get list of active, reachable users (excluding admin)"""
+        def _get_active_users(conn):
+            # Walk the primary key; +is_blocked keeps the planner off the (is_blocked, join_date) index
+            cursor = conn.execute('''
+                SELECT user_id FROM users
+                WHERE +is_blocked = 0 AND delivery_status = 'ok' AND user_id != ?
+                ORDER BY user_id
+            ''', (OWNER_USER_ID,))
+            return [row['user_id'] for row in cursor.fetchall()]
+
         try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT user_id FROM users WHERE is_blocked = 0 AND user_id != ?', (OWNER_USER_ID,))
-                return [row['user_id'] for row in cursor.fetchall()]
+            return await self._read(_get_active_users)
         except Exception as e:
             logger.error(f"Error getting active users: {e}")
             return []
-    
-    async def get_all_users_detailed(self) -> List[Tuple[int, str, str, str, int]]:
-        """Get all users with detailed information (excluding admin)"""
-        try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT user_id, username, first_name, last_name, is_blocked 
-                    FROM users WHERE user_id != ? ORDER BY join_date DESC
-                ''', (OWNER_USER_ID,))
-                return [(row['user_id'], row['username'], row['first_name'], 
-                        row['last_name'], row['is_blocked']) for row in cursor.fetchall()]
-        except Exception as e:
-            logger.error(f"Error getting all users detailed: {e}")
-            return []
-        try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                if exclude_blocked:
-                    cursor.execute('SELECT user_id FROM users WHERE is_blocked = 0')
-                else:
-                    cursor.execute('SELECT user_id FROM users')
-                return [row['user_id'] for row in cursor.fetchall()]
-        except Exception as e:
-            logger.error(f"Error getting all users: {e}")
-            return []
-    
+
+    async def iter_active_user_ids(self, after_user_id: int = 0,
+                                   batch_size: int = 1000) -> AsyncIterator[List[int]]:
+        """Yield ids of active, reachable users (excluding admin) in ascending batches.
+
+        Each batch is a keyset page on the primary key (user_id > last seen),
+        so memory stays at one batch regardless of how many users exist.
+        """
+        def _fetch_batch(conn, after):
+            # Unary + keeps the planner off idx_users_blocked_join_date: that index matches
+            # is_blocked = 0 but would need a full scan plus a sort for every batch
+            cursor = conn.execute('''
+                SELECT user_id FROM users
+                WHERE user_id > ? AND +is_blocked = 0 AND delivery_status = 'ok' AND user_id != ?
+                ORDER BY user_id LIMIT ?
+            ''', (after, OWNER_USER_ID, batch_size))
+            return [row['user_id'] for row in cursor.fetchall()]
+
+        while True:
+            batch = await self._read(_fetch_batch, after_user_id)
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            after_user_id = batch[-1]
+
     async def get_user_count(self) -> int:
         """Get total user count"""
+        def _get_user_count(conn):
+            result = conn.execute(
+                'SELECT total_users - blocked_users - unreachable_users as count FROM stats_counters WHERE id = 1'
+            ).fetchone()
+            return result['count'] if result else 0
+
         try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT COUNT(*) as count FROM users WHERE is_blocked = 0')
-                result = cursor.fetchone()
-                return result['count'] if result else 0
+            return await self._read(_get_user_count)
         except Exception as e:
             logger.error(f"Error getting user count: {e}")
             return 0
-    
+
     async def get_blocked_users(self):
         """Get list of blocked users"""
+        def _get_blocked_users(conn):
+            cursor = conn.execute('''
+                SELECT user_id, username, first_name, last_name
+                FROM users WHERE is_blocked = 1 AND user_id != ?
+                ORDER BY join_date DESC
+            ''', (OWNER_USER_ID,))
+            return [(row['user_id'], row['username'], row['first_name'], row['last_name'])
+                   for row in cursor.fetchall()]
+
         try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT user_id, username, first_name, last_name 
-                    FROM users WHERE is_blocked = 1 AND user_id != ? 
-                    ORDER BY join_date DESC
-                ''', (OWNER_USER_ID,))
-                return [(row['user_id'], row['username'], row['first_name'], row['last_name']) 
-                       for row in cursor.fetchall()]
+            return await self._read(_get_blocked_users)
         except Exception as e:
             logger.error(f"Error getting blocked users: {e}")
             return []
-    
+
     async def get_stats(self):
         """Get system statistics"""
+        def _get_stats(conn):
+            return self._read_counters(conn)
+
         try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Total number of users (excluding admin)
-                cursor.execute('SELECT COUNT(*) as count FROM users WHERE user_id != ?', (OWNER_USER_ID,))
-                total_users = cursor.fetchone()['count']
-                
-                # Active users
-                cursor.execute('SELECT COUNT(*) as count FROM users WHERE is_blocked = 0 AND user_id != ?', (OWNER_USER_ID,))
-                active_users = cursor.fetchone()['count']
-                
-                # Blocked users
-                cursor.execute('SELECT COUNT(*) as count FROM users WHERE is_blocked = 1 AND user_id != ?', (OWNER_USER_ID,))
-                blocked_users = cursor.fetchone()['count']
-                
-                # Total number of messages
-                cursor.execute('SELECT COUNT(*) as count FROM messages')
-                total_messages = cursor.fetchone()['count']
-                
-                return {
-                    'total_users': total_users,
-                    'active_users': active_users,
-                    'blocked_users': blocked_users,
-                    'total_messages': total_messages
-                }
+            return await self._read(_get_stats)
         except Exception as e:
             logger.error(f"Error getting stats: {e}")
             return {
                 'total_users': 0,
                 'active_users': 0,
                 'blocked_users': 0,
+                'unreachable_users': 0,
                 'total_messages': 0
             }
-    
+
+    async def rebuild_stats(self) -> bool:
+        """Recompute the statistics counters from the users and messages tables"""
+        try:
+            await self._write(recount_stats)
+            logger.info("Statistics counters rebuilt")
+            return True
+        except Exception as e:
+            logger.error(f"Error rebuilding stats: {e}")
+            return False
+
     async def get_all_users_detailed(self) -> List[Tuple[int, str, str, str, int]]:
         """Get all users with detailed information"""
+        def _get_all_users_detailed(conn):
+            cursor = conn.execute('''
+                SELECT user_id, username, first_name, last_name, is_blocked
+                FROM users ORDER BY join_date DESC
+            ''')
+            return [(row['user_id'], row['username'], row['first_name'],
+                    row['last_name'], row['is_blocked']) for row in cursor.fetchall()]
+
         try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT user_id, username, first_name, last_name, is_blocked 
-                    FROM users ORDER BY join_date DESC
-                ''')
-                return [(row['user_id'], row['username'], row['first_name'], 
-                        row['last_name'], row['is_blocked']) for row in cursor.fetchall()]
+            return await self._read(_get_all_users_detailed)
         except Exception as e:
             logger.error(f"Error getting all users detailed: {e}")
             return []
 
     async def block_user(self, user_id: int) -> bool:
-        """Block a user"""
+        """Block a user, creating their row (from the cached profile) if they never ran /start"""
+        username, first_name, last_name = self._profiles.get(user_id) or (None, None, None)
+
+        def _block_user(conn):
+            # Without a row the block would only live in memory: lost on restart, missing
+            # from the block list and impossible to undo
+            return conn.execute('''
+                INSERT INTO users (user_id, username, first_name, last_name, join_date, is_blocked)
+                VALUES (?, ?, ?, ?, ?, 1)
+                ON CONFLICT (user_id) DO UPDATE SET is_blocked = 1
+            ''', (user_id, username, first_name, last_name, datetime.now().isoformat())).rowcount
+
         try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('UPDATE users SET is_blocked = 1 WHERE user_id = ?', (user_id,))
-                conn.commit()
-                logger.info(f"User {user_id} blocked successfully")
-                return True
+            if not await self._write(_block_user):
+                logger.error(f"Blocking user {user_id} changed no rows")
+                return False
+            self._blocked_ids.add(user_id)
+            logger.info(f"User {user_id} blocked successfully")
+            return True
         except Exception as e:
             logger.error(f"Error blocking user {user_id}: {e}")
             return False
-    
+
     async def unblock_user(self, user_id: int) -> bool:
         """Unblock a user"""
+        def _unblock_user(conn):
+            conn.execute('UPDATE users SET is_blocked = 0 WHERE user_id = ?', (user_id,))
+
         try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('UPDATE users SET is_blocked = 0 WHERE user_id = ?', (user_id,))
-                conn.commit()
-                logger.info(f"User {user_id} unblocked successfully")
-                return True
+            await self._write(_unblock_user)
+            self._blocked_ids.discard(user_id)
+            logger.info(f"User {user_id} unblocked successfully")
+            return True
         except Exception as e:
             logger.error(f"Error unblocking user {user_id}: {e}")
             return False
 
-    async def is_user_blocked(self, user_id: int) -> bool:
-        """Check if user is blocked"""
+    async def create_broadcast_job(self, chat_id: int, progress_message_id: int, text: Optional[str] = None,
+                                   source_chat_id: Optional[int] = None,
+                                   source_message_ids: Optional[List[int]] = None) -> Optional[int]:
+        """Persist a new broadcast job (text, or messages to copy) and return its id"""
+        message_ids = ','.join(map(str, source_message_ids)) if source_message_ids else None
+
+        def _create_job(conn):
+            cursor = conn.execute('''
+                INSERT INTO broadcast_jobs
+                (chat_id, progress_message_id, text, source_chat_id, source_message_ids, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (chat_id, progress_message_id, text, source_chat_id, message_ids,
+                 datetime.now().isoformat()))
+            return cursor.lastrowid
+
+        try:
+            return await self._write(_create_job)
+        except Exception as e:
+            logger.error(f"Error creating broadcast job: {e}")
+            return None
+
+    async def update_broadcast_job(self, job_id: int, last_user_id: int, success_count: int,
+                                   fail_count: int, status: str = 'running') -> bool:
+        """Checkpoint broadcast progress (recipients up to last_user_id are done)"""
+        def _update_job(conn):
+            conn.execute('''
+                UPDATE broadcast_jobs
+                SET last_user_id = ?, success_count = ?, fail_count = ?, status = ?,
+                    finished_at = CASE WHEN ? = 'running' THEN NULL ELSE ? END
+                WHERE id = ?
+            ''', (last_user_id, success_count, fail_count, status,
+                 status, datetime.now().isoformat(), job_id))
+
+        try:
+            await self._write(_update_job)
+            return True
+        except Exception as e:
+            logger.error(f"Error updating broadcast job {job_id}: {e}")
+            return False
+
+    async def get_unfinished_broadcast_jobs(self) -> List[dict]:
+        """Get broadcast jobs that were interrupted before completing"""
+        def _get_jobs(conn):
+            cursor = conn.execute('''
+                SELECT id, chat_id, progress_message_id, text, source_chat_id, source_message_ids,
+                       last_user_id, success_count, fail_count
+                FROM broadcast_jobs WHERE status = 'running' ORDER BY id
+            ''')
+            jobs = []
+            for row in cursor.fetchall():
+                job = dict(row)
+                ids = job['source_message_ids']
+                job['source_message_ids'] = [int(i) for i in ids.split(',')] if ids else None
+                jobs.append(job)
+            return jobs
+
+        try:
+            return await self._read(_get_jobs)
+        except Exception as e:
+            logger.error(f"Error getting unfinished broadcast jobs: {e}")
+            return []
+
+    async def mark_users_unreachable(self, statuses: dict) -> bool:
+        """Record failed deliveries as {user_id: status}, e.g. 'blocked_bot' or 'chat_not_found'"""
+        if not statuses:
+            return True
+
+        def _mark_unreachable(conn):
+            conn.executemany('''
+                UPDATE users SET delivery_status = ?, unreachable_since = COALESCE(unreachable_since, ?)
+                WHERE user_id = ?
+            ''', [(status, datetime.now().isoformat(), user_id) for user_id, status in statuses.items()])
+
+        try:
+            await self._write(_mark_unreachable)
+            self._unreachable_ids.update(statuses)
+            logger.info(f"Marked {len(statuses)} users unreachable")
+            return True
+        except Exception as e:
+            logger.error(f"Error marking users unreachable: {e}")
+            return False
+
+    async def mark_user_reachable(self, user_id: int) -> bool:
+        """Reactivate a user who contacted the bot again (no write unless they were unreachable)"""
+        if user_id not in self._unreachable_ids:
+            return True
+
+        def _mark_reachable(conn):
+            conn.execute('''
+                UPDATE users SET delivery_status = 'ok', unreachable_since = NULL WHERE user_id = ?
+            ''', (user_id,))
+
+        try:
+            await self._write(_mark_reachable)
+            self._unreachable_ids.discard(user_id)
+            logger.info(f"User {user_id} is reachable again")
+            return True
+        except Exception as e:
+            logger.error(f"Error reactivating user {user_id}: {e}")
+            return False
+
+    async def backfill_search_index(self, batch_size: int = SEARCH_BACKFILL_BATCH) -> int:
+        """Index the next (newest) batch of messages older than the search index; returns what is left"""
+        def _backfill(conn):
+            cursor = conn.execute('SELECT backfill_cursor FROM search_index_state WHERE id = 1').fetchone()[0]
+            if cursor <= 0:
+                return 0
+            low = max(0, cursor - batch_size)
+            conn.execute('''
+                INSERT INTO messages_fts (rowid, message)
+                SELECT id, message FROM messages WHERE id > ? AND id <= ?
+            ''', (low, cursor))
+            conn.execute('UPDATE search_index_state SET backfill_cursor = ? WHERE id = 1', (low,))
+            return low
+
+        return await self._write(_backfill)
+
+    def start_search_backfill(self):
+        """Index pre-existing messages in the background, one short write transaction at a time"""
+        if self._search_backfill_task is None:
+            self._search_backfill_task = asyncio.get_running_loop().create_task(self._run_search_backfill())
+
+    async def _run_search_backfill(self):
+        try:
+            remaining = await self.backfill_search_index()
+            if not remaining:
+                return
+            logger.info("Building the search index for existing messages in the background")
+            while remaining:
+                # Leave the writer free for live traffic between batches
+                await asyncio.sleep(SEARCH_BACKFILL_PAUSE)
+                remaining = await self.backfill_search_index()
+            logger.info("Search index is complete")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error building the search index: {e}")
+
+    @staticmethod
+    def _fts_query(terms: str) -> str:
+        """Quote each term so user input is matched literally, never parsed as FTS5 syntax"""
+        return ' '.join('"' + term.replace('"', '""') + '"' for term in terms.split())
+
+    async def search_messages(self, terms: str, limit: int, offset: int = 0) -> List[dict]:
+        """Messages containing all terms, best match first (bm25), with sender profile and snippet"""
+        match = self._fts_query(terms)
+        if not match:
+            return []
+
+        def _search(conn):
+            cursor = conn.execute('''
+                SELECT m.id, m.user_id, m.timestamp, u.username, u.first_name, u.last_name,
+                       snippet(messages_fts, 0, '«', '»', '…', 16) AS snippet
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                LEFT JOIN users u ON u.user_id = m.user_id
+                WHERE messages_fts MATCH ?
+                ORDER BY rank
+                LIMIT ? OFFSET ?
+            ''', (match, limit, offset))
+            return [dict(row) for row in cursor.fetchall()]
+
+        try:
+            return await self._read(_search)
+        except Exception as e:
+            logger.error(f"Error searching messages for {terms!r}: {e}")
+            return []
+
+    async def get_expired_messages(self, cutoff: str, limit: int) -> List[dict]:
+        """Oldest messages with a timestamp before cutoff, in id order (ids follow arrival time)"""
+        def _get_expired(conn):
+            cursor = conn.execute('''
+                SELECT id, user_id, message, timestamp FROM messages ORDER BY id LIMIT ?
+            ''', (limit,))
+            rows = []
+            for row in cursor.fetchall():
+                if (row['timestamp'] or '') >= cutoff:
+                    break
+                rows.append(dict(row))
+            return rows
+
+        try:
+            return await self._read(_get_expired)
+        except Exception as e:
+            logger.error(f"Error getting expired messages: {e}")
+            return []
+
+    async def delete_archived_messages(self, upto_id: int, ranges: List[Tuple[int, str, int, int]]) -> int:
+        """Delete messages up to upto_id (already archived), keeping them in the message total.
+
+        ranges are (user_id, segment, first_id, last_id) for the archived rows and are recorded
+        in the same transaction, so the archive index never points at rows still in the database.
+        """
+        def _delete(conn):
+            deleted = conn.execute('DELETE FROM messages WHERE id <= ?', (upto_id,)).rowcount
+            conn.execute(
+                'UPDATE stats_counters SET archived_messages = archived_messages + ? WHERE id = 1', (deleted,)
+            )
+            conn.executemany('''
+                INSERT INTO archived_ranges (user_id, segment, first_id, last_id) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, segment) DO UPDATE SET
+                    first_id = MIN(first_id, excluded.first_id),
+                    last_id = MAX(last_id, excluded.last_id)
+            ''', ranges)
+            return deleted
+
+        return await self._write(_delete)
+
+    async def get_archived_segments(self, user_id: int, before_id: int = 0) -> List[str]:
+        """Archive segments holding messages of user_id older than before_id (0 = any), newest first"""
+        def _get_segments(conn):
+            cursor = conn.execute('''
+                SELECT segment FROM archived_ranges
+                WHERE user_id = ? AND (? = 0 OR first_id < ?)
+                ORDER BY last_id DESC
+            ''', (user_id, before_id, before_id))
+            return [row['segment'] for row in cursor.fetchall()]
+
         try:
-            async with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT is_blocked FROM users WHERE user_id = ?', (user_id,))
-                result = cursor.fetchone()
-                return bool(result['is_blocked']) if result else False
+            return await self._read(_get_segments)
         except Exception as e:
-            logger.error(f"Error checking if user {user_id} is blocked: {e}")
+            logger.error(f"Error getting archived segments of user {user_id}: {e}")
+            return []
+
+    async def reclaim_space(self) -> int:
+        """Return free pages to the file system (needs auto_vacuum = INCREMENTAL); returns pages freed"""
+        def _reclaim(conn):
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            # execute() steps the pragma once, freeing a single page; executescript runs it to completion
+            conn.executescript('PRAGMA incremental_vacuum')
+            return free_pages - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+        return await self._write(_reclaim)
+
+    async def get_auto_vacuum_mode(self) -> int:
+        """PRAGMA auto_vacuum: 0 = none, 1 = full, 2 = incremental"""
+        return await self._read(lambda conn: conn.execute('PRAGMA auto_vacuum').fetchone()[0])
+
+    async def get_user_data_ids(self) -> set:
+        """IDs of users with persisted conversation state"""
+        def _get_ids(conn):
+            cursor = conn.execute('SELECT DISTINCT user_id FROM user_data')
+            return {row['user_id'] for row in cursor.fetchall()}
+
+        try:
+            return await self._read(_get_ids)
+        except Exception as e:
+            logger.error(f"Error getting persisted user data ids: {e}")
+            return set()
+
+    async def load_user_data(self, user_id: int) -> Dict[str, bytes]:
+        """Persisted conversation state of one user, as serialized values per key"""
+        def _load(conn):
+            cursor = conn.execute('SELECT key, value FROM user_data WHERE user_id = ?', (user_id,))
+            return {row['key']: row['value'] for row in cursor.fetchall()}
+
+        try:
+            return await self._read(_load)
+        except Exception as e:
+            logger.error(f"Error loading user data for {user_id}: {e}")
+            return {}
+
+    async def save_user_data(self, changes: Dict[int, Tuple[Dict[str, bytes], List[str]]]) -> bool:
+        """Write changed keys and delete removed keys for several users in one transaction"""
+        def _save(conn):
+            conn.executemany('''
+                INSERT INTO user_data (user_id, key, value) VALUES (?, ?, ?)
+                ON CONFLICT (user_id, key) DO UPDATE SET value = excluded.value
+            ''', [(user_id, key, value)
+                  for user_id, (changed, _) in changes.items()
+                  for key, value in changed.items()])
+            conn.executemany('DELETE FROM user_data WHERE user_id = ? AND key = ?',
+                             [(user_id, key)
+                              for user_id, (_, removed) in changes.items()
+                              for key in removed])
+
+        try:
+            await self._write(_save)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving user data: {e}")
+            return False
+
+    async def delete_user_data(self, user_id: int) -> bool:
+        """Remove all persisted conversation state of a user"""
+        def _delete(conn):
+            conn.execute('DELETE FROM user_data WHERE user_id = ?', (user_id,))
+
+        try:
+            await self._write(_delete)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting user data for {user_id}: {e}")
             return False
 
+    def is_blocked(self, user_id: int) -> bool:
+        """Check the in-memory blocked set (kept in sync by block_user/unblock_user)"""
+        return user_id in self._blocked_ids
+
+    async def is_user_blocked(self, user_id: int) -> bool:
+        """Check if user is blocked"""
+        return self.is_blocked(user_id)
+
 # Global database instance
 db_manager = DatabaseManager()
\ No newline at end of file
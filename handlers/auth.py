@@ -1,5 +1,8 @@
 import os
 from dotenv import load_dotenv
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+from database import db_manager
 
 # Load environment variables
 load_dotenv()
@@ -7,4 +10,16 @@ OWNER_USER_ID = int(os.getenv('OWNER_USER_ID', 0))
 
 def is_owner(user_id):
     """Check if user is owner"""
-    return user_id == OWNER_USER_ID
\ No newline at end of file
+    return user_id == OWNER_USER_ID
+
+async def drop_blocked_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stop updates from blocked users before any other handler runs"""
+    user = update.effective_user
+    if user is None or is_owner(user.id) or not db_manager.is_blocked(user.id):
+        return
+    
+    if update.callback_query:
+        await update.callback_query.answer()
+    elif update.message:
+        await update.message.reply_text("❌ You have been blocked by the bot owner and cannot send messages.")
+    raise ApplicationHandlerStop
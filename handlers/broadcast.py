@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import os
+from typing import List, Optional
+from dotenv import load_dotenv
+from telegram import Bot
+from telegram.error import RetryAfter, TimedOut, NetworkError, Forbidden, BadRequest
+from database import db_manager
+from rate_limit import TokenBucket
+
+# Load environment variables
+load_dotenv()
+# Telegram allows roughly 30 messages per second across all chats
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 25))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', 10))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv('BROADCAST_PROGRESS_INTERVAL', 5))
+BROADCAST_MAX_RETRIES = 3
+# Recipients sent between progress checkpoints; at most this many are re-sent after a crash
+BROADCAST_CHUNK_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+def classify_delivery_error(error: Exception) -> Optional[str]:
+    """Map a send error to a permanent delivery status, or None if it may succeed later"""
+    message = str(error).lower()
+    if isinstance(error, Forbidden):
+        if 'deactivated' in message:
+            return 'deactivated'
+        return 'blocked_bot'
+    if isinstance(error, BadRequest) and 'chat not found' in message:
+        return 'chat_not_found'
+    return None
+
+class BroadcastEngine:
+    """Runs broadcast jobs in the background.
+
+    Sends are paced by a shared token bucket and bounded by a semaphore.
+    Progress is checkpointed in the broadcast_jobs table after every chunk of
+    recipients (ordered by user_id), so an interrupted job resumes where it
+    stopped on the next start.
+    """
+
+    def __init__(self, rate: float = BROADCAST_RATE, concurrency: int = BROADCAST_CONCURRENCY):
+        self._limiter = TokenBucket(rate)
+        self._concurrency = concurrency
+        self._tasks = {}
+
+    async def start(self, bot: Bot, chat_id: int, progress_message_id: int, text: Optional[str] = None,
+                    source_message_ids: Optional[List[int]] = None) -> bool:
+        """Persist a new job and run it in the background.
+
+        Text jobs send `text`; media jobs copy the owner's messages from `chat_id`
+        (an album when several ids are given), so the already-uploaded files are
+        reused and nothing is re-uploaded per recipient.
+        """
+        source_chat_id = chat_id if source_message_ids else None
+        job_id = await db_manager.create_broadcast_job(
+            chat_id, progress_message_id, text, source_chat_id, source_message_ids
+        )
+        if job_id is None:
+            return False
+        self._spawn(bot, {
+            'id': job_id,
+            'chat_id': chat_id,
+            'progress_message_id': progress_message_id,
+            'text': text,
+            'source_chat_id': source_chat_id,
+            'source_message_ids': source_message_ids,
+            'last_user_id': 0,
+            'success_count': 0,
+            'fail_count': 0
+        })
+        return True
+
+    async def resume(self, bot: Bot):
+        """Restart jobs interrupted by a shutdown or crash"""
+        for job in await db_manager.get_unfinished_broadcast_jobs():
+            logger.info(f"Resuming broadcast job {job['id']} after user {job['last_user_id']}")
+            self._spawn(bot, job)
+
+    async def shutdown(self):
+        """Stop running jobs; their last checkpoint is kept for resuming"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _spawn(self, bot: Bot, job: dict):
+        task = asyncio.get_running_loop().create_task(self._run(bot, job))
+        self._tasks[job['id']] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job['id'], None))
+
+    async def _run(self, bot: Bot, job: dict):
+        progress_task = asyncio.get_running_loop().create_task(self._report_progress(bot, job))
+        semaphore = asyncio.Semaphore(self._concurrency)
+        unreachable = {}
+
+        async def send(user_id):
+            async with semaphore:
+                if await self._send(bot, user_id, job, unreachable):
+                    job['success_count'] += 1
+                else:
+                    job['fail_count'] += 1
+
+        try:
+            async for chunk in db_manager.iter_active_user_ids(job['last_user_id'], BROADCAST_CHUNK_SIZE):
+                await asyncio.gather(*(send(user_id) for user_id in chunk))
+                # Skip users who blocked the bot or no longer exist in future broadcasts
+                await db_manager.mark_users_unreachable(unreachable)
+                unreachable.clear()
+                job['last_user_id'] = chunk[-1]
+                await db_manager.update_broadcast_job(
+                    job['id'], job['last_user_id'], job['success_count'], job['fail_count']
+                )
+            
+            await db_manager.update_broadcast_job(
+                job['id'], job['last_user_id'], job['success_count'], job['fail_count'], status='done'
+            )
+        except Exception as e:
+            # Leave the job marked running so it resumes from its last checkpoint
+            logger.error(f"Broadcast job {job['id']} stopped: {e}")
+            return
+        finally:
+            progress_task.cancel()
+
+        await self._edit_progress(
+            bot, job,
+            "✅ Broadcast completed!\n\n" +
+            f"📤 Successful sends: {job['success_count']}\n" +
+            f"❌ Failed sends: {job['fail_count']}"
+        )
+
+    @staticmethod
+    async def _deliver(bot: Bot, user_id: int, job: dict):
+        """One API call per recipient: plain text, a single copy or an album copy"""
+        message_ids = job['source_message_ids']
+        if not message_ids:
+            await bot.send_message(chat_id=user_id, text=job['text'])
+        elif len(message_ids) == 1:
+            await bot.copy_message(
+                chat_id=user_id, from_chat_id=job['source_chat_id'], message_id=message_ids[0]
+            )
+        else:
+            await bot.copy_messages(
+                chat_id=user_id, from_chat_id=job['source_chat_id'], message_ids=message_ids
+            )
+
+    async def _send(self, bot: Bot, user_id: int, job: dict, unreachable: dict) -> bool:
+        """Send to one recipient, honouring RetryAfter and retrying transient errors.
+
+        Recipients that can never be reached are added to `unreachable`.
+        """
+        # An album puts one message per item into the recipient's chat
+        cost = len(job['source_message_ids'] or ()) or 1
+        for attempt in range(BROADCAST_MAX_RETRIES + 1):
+            # More than a full bucket (an album at a low BROADCAST_RATE) is charged in bucket-sized parts
+            remaining = cost
+            while remaining > 0:
+                part = min(remaining, self._limiter.capacity)
+                await self._limiter.acquire(part)
+                remaining -= part
+            try:
+                await self._deliver(bot, user_id, job)
+                return True
+            except RetryAfter as e:
+                # Flood control applies to the whole bot, so pause every sender
+                logger.warning(f"Broadcast hit flood control, pausing {e.retry_after}s")
+                self._limiter.pause(e.retry_after)
+            except BadRequest as e:
+                # BadRequest subclasses NetworkError but is never worth retrying
+                return self._record_failure(user_id, e, unreachable)
+            except (TimedOut, NetworkError) as e:
+                logger.warning(f"Transient error sending broadcast to {user_id}: {e}")
+                await asyncio.sleep(2 ** attempt)
+            except Exception as e:
+                return self._record_failure(user_id, e, unreachable)
+        logger.error(f"Giving up on broadcast to {user_id} after {BROADCAST_MAX_RETRIES} retries")
+        return False
+
+    @staticmethod
+    def _record_failure(user_id: int, error: Exception, unreachable: dict) -> bool:
+        status = classify_delivery_error(error)
+        if status:
+            unreachable[user_id] = status
+            logger.info(f"Broadcast recipient {user_id} unreachable ({status})")
+        else:
+            logger.error(f"Failed to send broadcast to {user_id}: {error}")
+        return False
+
+    async def _report_progress(self, bot: Bot, job: dict):
+        """Periodically edit the progress message while the job runs"""
+        reported = None
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            counts = (job['success_count'], job['fail_count'])
+            if counts == reported:
+                continue
+            reported = counts
+            await self._edit_progress(
+                bot, job,
+                "📤 Sending broadcast message...\n\n" +
+                f"📤 Successful sends: {counts[0]}\n" +
+                f"❌ Failed sends: {counts[1]}"
+            )
+
+    async def _edit_progress(self, bot: Bot, job: dict, text: str):
+        if not job['progress_message_id']:
+            return
+        try:
+            await bot.edit_message_text(
+                chat_id=job['chat_id'], message_id=job['progress_message_id'], text=text
+            )
+        except Exception as e:
+            logger.warning(f"Could not update broadcast progress message: {e}")
+
+# Global broadcast engine instance
+broadcast_engine = BroadcastEngine()
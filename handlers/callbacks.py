@@ -5,6 +5,10 @@ from database import db_manager
 from .auth import is_owner
 from .channel import check_channel_membership
 from .keyboards import get_cancel_reply_keyboard
+from .formatting import get_user_header
+from .search import build_search_page
+from .history import build_history_page
+from .user_lists import build_user_list_page
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +20,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Check channel membership
     if data == "check_membership":
         user_id = query.from_user.id
-        is_member = await check_channel_membership(context, user_id)
+        # The user says they just joined, so don't trust a cached "not a member"
+        is_member = await check_channel_membership(context, user_id, force_refresh=True)
         
         if is_member:
             await query.answer()
@@ -28,6 +33,11 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.answer("❌ You haven't joined the channel yet! Please join the channel first.", show_alert=True)
         return
     
+    # Header buttons on relayed stickers, polls, etc. do nothing
+    if data == "noop":
+        await query.answer()
+        return
+    
     # Other callbacks are only for owner
     await query.answer()
     
@@ -41,6 +51,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await handle_unblock_callback(query, context, data)
     elif data.startswith('reply_'):
         await handle_reply_callback(query, context, data)
+    elif data.startswith('ul_') or data.startswith('bl_'):
+        await handle_user_list_callback(query, context, data)
+    elif data.startswith('hist_'):
+        await handle_history_callback(query, context, data)
+    elif data.startswith('search_'):
+        await handle_search_callback(query, context, data)
 
 async def handle_block_callback(query, context: ContextTypes.DEFAULT_TYPE, data: str):
     """Handle user blocking"""
@@ -48,14 +64,7 @@ async def handle_block_callback(query, context: ContextTypes.DEFAULT_TYPE, data:
     await db_manager.block_user(user_id)
     
     # Get blocked user information
-    username, first_name, last_name = await db_manager.get_user_info(user_id)
-    user_info = f"🆔 {user_id}"
-    if username:
-        user_info += f" | @{username}"
-    if first_name:
-        user_info += f" | {first_name}"
-    if last_name:
-        user_info += f" {last_name}"
+    user_info = await get_user_header(user_id)
     
     await query.edit_message_text(f"✅ User successfully blocked:\n{user_info}")
     
@@ -88,18 +97,46 @@ async def handle_reply_callback(query, context: ContextTypes.DEFAULT_TYPE, data:
     context.user_data['replying_to'] = user_id
     
     # Get information of user being replied to
-    username, first_name, last_name = await db_manager.get_user_info(user_id)
-    target_info = f"🆔 {user_id}"
-    if username:
-        target_info += f" | @{username}"
-    if first_name:
-        target_info += f" | {first_name}"
-    if last_name:
-        target_info += f" {last_name}"
+    target_info = await get_user_header(user_id)
     
     cancel_keyboard = get_cancel_reply_keyboard()
     
     await query.message.reply_text(
         f"📝 Replying to user:\n{target_info}\n\nPlease enter your reply:",
         reply_markup=cancel_keyboard
-    )
\ No newline at end of file
+    )
+
+async def handle_search_callback(query, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Show another page of the last search"""
+    page = int(data.split('_')[1])
+    terms = context.user_data.get('search_query')
+    if not terms:
+        await query.edit_message_text("🔎 This search has expired. Run /search again.")
+        return
+    
+    text, reply_markup = await build_search_page(terms, page)
+    await query.edit_message_text(text, reply_markup=reply_markup)
+
+async def handle_history_callback(query, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Show a user's message history: the first tap opens it, paging edits it in place"""
+    parts = data.split('_')
+    user_id = int(parts[1])
+    
+    if len(parts) == 2:
+        text, reply_markup = await build_history_page(user_id)
+        await query.message.reply_text(text, reply_markup=reply_markup)
+        return
+    
+    text, reply_markup = await build_history_page(user_id, int(parts[2]))
+    await query.edit_message_text(text, reply_markup=reply_markup)
+
+async def handle_user_list_callback(query, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Page through the user list (ul_) or block list (bl_) by editing the message"""
+    parts = data.split('_')
+    blocked_only = parts[0] == 'bl'
+    action = parts[1]
+    page = int(parts[2]) if len(parts) > 2 else 0
+    cursor_user_id = int(parts[3]) if len(parts) > 3 else None
+    
+    text, reply_markup = await build_user_list_page(blocked_only, action, page, cursor_user_id)
+    await query.edit_message_text(text, reply_markup=reply_markup)
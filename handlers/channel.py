@@ -3,21 +3,33 @@ import os
 from dotenv import load_dotenv
 from telegram import Update, ChatMember
 from telegram.ext import ContextTypes
+from cache import AsyncTTLCache
 from .keyboards import get_join_channel_keyboard
 
 # Load environment variables
 load_dotenv()
 force_chanel = os.getenv('FORCE_CHANNEL')
+# Members are re-checked after MEMBERSHIP_CACHE_TTL seconds, non-members sooner
+MEMBERSHIP_CACHE_TTL = float(os.getenv('MEMBERSHIP_CACHE_TTL', 3600))
+MEMBERSHIP_CACHE_NEGATIVE_TTL = float(os.getenv('MEMBERSHIP_CACHE_NEGATIVE_TTL', 60))
+MEMBERSHIP_CACHE_SIZE = int(os.getenv('MEMBERSHIP_CACHE_SIZE', 50000))
+
+# Membership results keyed by user_id
+membership_cache = AsyncTTLCache(MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_CACHE_TTL, MEMBERSHIP_CACHE_NEGATIVE_TTL)
 
 logger = logging.getLogger(__name__)
 
-async def check_channel_membership(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
-    """Check user membership in mandatory channel"""
-    try:
+async def check_channel_membership(context: ContextTypes.DEFAULT_TYPE, user_id: int,
+                                   force_refresh: bool = False) -> bool:
+    """Check user membership in mandatory channel (cached; concurrent checks share one API call)"""
+    async def fetch_membership():
         member = await context.bot.get_chat_member(chat_id=force_chanel, user_id=user_id)
         is_member = member.status in [ChatMember.MEMBER, ChatMember.ADMINISTRATOR, ChatMember.OWNER]
         logger.info(f"Checking membership for user {user_id}, result: {is_member}")
         return is_member
+    
+    try:
+        return await membership_cache.get_or_load(user_id, fetch_membership, force_refresh=force_refresh)
     except Exception as e:
         logger.error(f"Error checking channel membership for user {user_id}: {e}")
         return False
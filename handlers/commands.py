@@ -9,6 +9,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start command"""
     user = update.effective_user
     await db_manager.add_user(user.id, user.username, user.first_name, user.last_name)
+    await db_manager.mark_user_reachable(user.id)
     
     if is_owner(user.id):
         welcome_text = f"""
@@ -37,4 +38,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         ✨ Send your message...
         """
-        await update.message.reply_text(welcome_text)
\ No newline at end of file
+        await update.message.reply_text(welcome_text)
+
+async def recount_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Rebuild statistics counters (owner only)"""
+    if not is_owner(update.effective_user.id):
+        return
+    
+    if await db_manager.rebuild_stats():
+        await update.message.reply_text("✅ Statistics counters rebuilt.", reply_markup=get_owner_keyboard())
+    else:
+        await update.message.reply_text("❌ Error rebuilding statistics.", reply_markup=get_owner_keyboard())
\ No newline at end of file
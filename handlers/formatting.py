@@ -0,0 +1,27 @@
+from typing import Optional
+from telegram import User
+from database import db_manager
+
+def _name_suffix(username: Optional[str], first_name: Optional[str], last_name: Optional[str]) -> str:
+    suffix = ""
+    if username:
+        suffix += f" | @{username}"
+    if first_name:
+        suffix += f" | {first_name}"
+    if last_name:
+        suffix += f" {last_name}"
+    return suffix
+
+def format_user_info(user_id: int, username: Optional[str] = None,
+                     first_name: Optional[str] = None, last_name: Optional[str] = None) -> str:
+    """User header: 🆔 id | @username | first last"""
+    return f"🆔 {user_id}" + _name_suffix(username, first_name, last_name)
+
+def format_sender_info(user: User) -> str:
+    """Sender header shown to the owner on forwarded messages"""
+    return f"👤 Sender: ID {user.id}" + _name_suffix(user.username, user.first_name, user.last_name)
+
+async def get_user_header(user_id: int) -> str:
+    """User header built from the cached profile"""
+    username, first_name, last_name = await db_manager.get_user_info(user_id)
+    return format_user_info(user_id, username, first_name, last_name)
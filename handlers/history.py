@@ -0,0 +1,40 @@
+import logging
+from typing import Tuple
+from telegram import InlineKeyboardMarkup
+from database import db_manager
+from retention import message_archiver
+from .formatting import get_user_header
+from .keyboards import get_history_keyboard
+
+HISTORY_PAGE_SIZE = 10
+# Keeps a full page under Telegram's 4096 character limit
+HISTORY_ITEM_LENGTH = 300
+
+logger = logging.getLogger(__name__)
+
+async def build_history_page(user_id: int, before_id: int = 0) -> Tuple[str, InlineKeyboardMarkup]:
+    """One page of a user's messages, newest first, starting below before_id (0 = newest)"""
+    # One extra row tells whether an older page exists
+    rows = await db_manager.get_user_messages(user_id, before_id, HISTORY_PAGE_SIZE + 1)
+    if len(rows) <= HISTORY_PAGE_SIZE:
+        # Continue into archived messages; their ids are all lower than the ones still in the database
+        rows += await message_archiver.read_user_messages(
+            user_id, rows[-1]['id'] if rows else before_id, HISTORY_PAGE_SIZE + 1 - len(rows)
+        )
+    has_older = len(rows) > HISTORY_PAGE_SIZE
+    rows = rows[:HISTORY_PAGE_SIZE]
+    
+    header = await get_user_header(user_id)
+    if not rows:
+        text = f"📜 History of {header}\n\nNo messages found."
+        return text, get_history_keyboard(user_id, before_id, False, before_id == 0)
+    
+    text = f"📜 History of {header}\n"
+    for row in rows:
+        message = row['message'] or ''
+        if len(message) > HISTORY_ITEM_LENGTH:
+            message = message[:HISTORY_ITEM_LENGTH] + "…"
+        timestamp = (row['timestamp'] or '')[:16].replace('T', ' ')
+        text += f"\n🕒 {timestamp}\n💬 {message}\n"
+    
+    return text, get_history_keyboard(user_id, rows[-1]['id'], has_older, before_id == 0)
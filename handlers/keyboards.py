@@ -21,10 +21,59 @@ def get_reply_block_keyboard(user_id):
     """Reply and block keyboard"""
     keyboard = [
         [InlineKeyboardButton("📨 Reply", callback_data=f"reply_{user_id}"),
-         InlineKeyboardButton("🚫 Block", callback_data=f"block_{user_id}")]
+         InlineKeyboardButton("🚫 Block", callback_data=f"block_{user_id}"),
+         InlineKeyboardButton("📜 History", callback_data=f"hist_{user_id}")]
     ]
     return InlineKeyboardMarkup(keyboard)
 
+def get_digest_keyboard(user_ids):
+    """Reply and block buttons for each sender of a digest, numbered like the digest"""
+    keyboard = [
+        [InlineKeyboardButton(f"📨 Reply [{number}]", callback_data=f"reply_{user_id}"),
+         InlineKeyboardButton(f"🚫 Block [{number}]", callback_data=f"block_{user_id}")]
+        for number, user_id in enumerate(user_ids, start=1)
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def with_header_button(header, reply_markup=None):
+    """Show a header as an inert top button, for message kinds that cannot carry a caption"""
+    keyboard = [[InlineKeyboardButton(header, callback_data="noop")]]
+    if reply_markup:
+        keyboard.extend(reply_markup.inline_keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+def get_search_keyboard(page, has_next):
+    """Previous/next page buttons for search results"""
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀️ Previous", callback_data=f"search_{page - 1}"))
+    if has_next:
+        row.append(InlineKeyboardButton("Next ▶️", callback_data=f"search_{page + 1}"))
+    return InlineKeyboardMarkup([row]) if row else None
+
+def get_history_keyboard(user_id, oldest_id, has_older, is_latest):
+    """Navigation for a user's message history (keyset: older pages start below oldest_id)"""
+    row = []
+    if not is_latest:
+        row.append(InlineKeyboardButton("⏮ Latest", callback_data=f"hist_{user_id}_0"))
+    if has_older:
+        row.append(InlineKeyboardButton("Older ▶️", callback_data=f"hist_{user_id}_{oldest_id}"))
+    keyboard = [row] if row else []
+    keyboard.append([InlineKeyboardButton("📨 Reply", callback_data=f"reply_{user_id}")])
+    return InlineKeyboardMarkup(keyboard)
+
+def get_list_navigation_row(prefix, page, pages, first_user_id, last_user_id):
+    """First/previous/page/next/last buttons for a keyset-paged list (callback data carries the edge user IDs)"""
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("⏮", callback_data=f"{prefix}_f"))
+        row.append(InlineKeyboardButton("◀️", callback_data=f"{prefix}_p_{page - 1}_{first_user_id}"))
+    row.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="noop"))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton("▶️", callback_data=f"{prefix}_n_{page + 1}_{last_user_id}"))
+        row.append(InlineKeyboardButton("⏭", callback_data=f"{prefix}_l"))
+    return row
+
 def get_cancel_reply_keyboard():
     """Cancel reply keyboard"""
     return ReplyKeyboardMarkup(
@@ -1,9 +1,13 @@
 import logging
 import os
 from dotenv import load_dotenv
-from telegram import Update, User
+from typing import List, Optional
+from telegram import Bot, InlineKeyboardMarkup, Message, Update, User
 from telegram.ext import ContextTypes
-from .keyboards import get_reply_block_keyboard
+from .keyboards import get_reply_block_keyboard, with_header_button
+from .formatting import format_sender_info
+from .owner_inbox import owner_inbox
+from .media_group import media_group_collector
 
 # Load environment variables
 load_dotenv()
@@ -11,125 +15,97 @@ OWNER_USER_ID = int(os.getenv('OWNER_USER_ID', 0))
 
 logger = logging.getLogger(__name__)
 
+def has_media(message) -> bool:
+    """Check whether a message is anything other than plain text (media, sticker, poll, location, ...)"""
+    return message.text is None
+
+def _can_have_caption(message) -> bool:
+    return bool(message.photo or message.video or message.document or
+                message.audio or message.voice or message.animation)
+
+async def relay_message(bot: Bot, message: Message, chat_id: int, header: Optional[str] = None,
+                        parse_mode: Optional[str] = None, reply_markup: Optional[InlineKeyboardMarkup] = None,
+                        header_label: Optional[str] = None):
+    """Deliver any kind of message to chat_id in a single API call.
+
+    Text is re-sent with the header on top. Everything else is copied with
+    copy_message: the header goes into the caption where the kind allows one,
+    otherwise (stickers, video notes, polls, locations, contacts, ...) it is
+    shown as an inert top button labelled `header_label`.
+    """
+    if message.text is not None:
+        text = f"{header}\n\n{message.text}" if header else message.text
+        return await bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode, reply_markup=reply_markup)
+    
+    caption = None
+    if header and _can_have_caption(message):
+        caption = f"{header}\n\n{message.caption}" if message.caption else header
+    elif header:
+        reply_markup = with_header_button(header_label or header, reply_markup)
+    
+    return await bot.copy_message(
+        chat_id=chat_id,
+        from_chat_id=message.chat_id,
+        message_id=message.message_id,
+        caption=caption,
+        parse_mode=parse_mode if caption else None,
+        reply_markup=reply_markup
+    )
+
+async def forward_album_to_owner(context: ContextTypes.DEFAULT_TYPE, messages: List[Message], user: User):
+    """Send a buffered album to the owner: the items in one call, then one header with the actions"""
+    sender_info = format_sender_info(user)
+    
+    async def send_album():
+        await context.bot.copy_messages(
+            chat_id=OWNER_USER_ID,
+            from_chat_id=messages[0].chat_id,
+            message_ids=[m.message_id for m in messages]
+        )
+    
+    async def send_header():
+        await context.bot.send_message(
+            chat_id=OWNER_USER_ID,
+            text=f"{sender_info}\n\n📎 Album with {len(messages)} items above",
+            reply_markup=get_reply_block_keyboard(user.id)
+        )
+    
+    async def acknowledge(delivered: bool):
+        if delivered:
+            await messages[0].reply_text("✅ Your album was sent successfully!")
+        else:
+            await messages[0].reply_text("❌ Error sending media. Please try again later.")
+    
+    # Separate steps, so flood control on the header does not copy the album a second time
+    owner_inbox.deliver(context.bot, (send_album, len(messages)), (send_header, 1), on_done=acknowledge)
+
 async def forward_media_to_owner(update: Update, context: ContextTypes.DEFAULT_TYPE, user: User):
     """Send media to owner"""
+    if update.message.media_group_id:
+        # Album items arrive as separate updates; forward them together once all have arrived
+        async def forward_album(messages):
+            await forward_album_to_owner(context, messages, user)
+        
+        media_group_collector.add(update.message, forward_album)
+        return
+    
     try:
-        sender_info = f"👤 Sender: ID {user.id}"
-        if user.username:
-            sender_info += f" | @{user.username}"
-        if user.first_name:
-            sender_info += f" | {user.first_name}"
-        if user.last_name:
-            sender_info += f" {user.last_name}"
+        sender_info = format_sender_info(user)
         
-        reply_markup = get_reply_block_keyboard(user.id)
+        async def send_to_owner():
+            await relay_message(context.bot, update.message, OWNER_USER_ID, header=sender_info,
+                                reply_markup=get_reply_block_keyboard(user.id))
         
-        # Check media type and send to owner
-        if update.message.photo:
-            file_id = update.message.photo[-1].file_id
-            caption = update.message.caption or ""
-            full_caption = f"{sender_info}\n\n{caption}" if caption else sender_info
-            
-            await context.bot.send_photo(
-                chat_id=OWNER_USER_ID,
-                photo=file_id,
-                caption=full_caption,
-                reply_markup=reply_markup
-            )
-            
-        elif update.message.video:
-            file_id = update.message.video.file_id
-            caption = update.message.caption or ""
-            full_caption = f"{sender_info}\n\n{caption}" if caption else sender_info
-            
-            await context.bot.send_video(
-                chat_id=OWNER_USER_ID,
-                video=file_id,
-                caption=full_caption,
-                reply_markup=reply_markup
-            )
-            
-        elif update.message.document:
-            file_id = update.message.document.file_id
-            caption = update.message.caption or ""
-            full_caption = f"{sender_info}\n\n{caption}" if caption else sender_info
-            
-            await context.bot.send_document(
-                chat_id=OWNER_USER_ID,
-                document=file_id,
-                caption=full_caption,
-                reply_markup=reply_markup
-            )
-            
-        elif update.message.audio:
-            file_id = update.message.audio.file_id
-            caption = update.message.caption or ""
-            full_caption = f"{sender_info}\n\n{caption}" if caption else sender_info
-            
-            await context.bot.send_audio(
-                chat_id=OWNER_USER_ID,
-                audio=file_id,
-                caption=full_caption,
-                reply_markup=reply_markup
-            )
-            
-        elif update.message.voice:
-            file_id = update.message.voice.file_id
-            await context.bot.send_voice(
-                chat_id=OWNER_USER_ID,
-                voice=file_id,
-                caption=sender_info,
-                reply_markup=reply_markup
-            )
-            
-        elif update.message.sticker:
-            file_id = update.message.sticker.file_id
-            await context.bot.send_sticker(
-                chat_id=OWNER_USER_ID,
-                sticker=file_id,
-                reply_markup=reply_markup
-            )
+        async def acknowledge(delivered: bool):
+            if delivered:
+                await update.message.reply_text("✅ Your media was sent successfully!")
+            else:
+                await update.message.reply_text("❌ Error sending media. Please try again later.")
         
-        await update.message.reply_text("✅ Your media was sent successfully!")
+        # Paced through the owner inbox to stay within the owner chat's limit; the update
+        # handler returns right away and the user hears back once the media is delivered
+        owner_inbox.deliver(context.bot, (send_to_owner, 1), on_done=acknowledge)
         
     except Exception as e:
         logger.error(f"Error sending media: {e}")
         await update.message.reply_text("❌ Error sending media. Please try again later.")
-        
-async def forward_media_from_owner(message, context: ContextTypes.DEFAULT_TYPE, target_user_id: int):
-    """Send media from owner to user"""
-    try:
-        # Check media type and send to user
-        if message.photo:
-            file_id = message.photo[-1].file_id
-            caption = message.caption or ""
-            await context.bot.send_photo(chat_id=target_user_id, photo=file_id, caption=caption)
-            
-        elif message.video:
-            file_id = message.video.file_id
-            caption = message.caption or ""
-            await context.bot.send_video(chat_id=target_user_id, video=file_id, caption=caption)
-            
-        elif message.document:
-            file_id = message.document.file_id
-            caption = message.caption or ""
-            await context.bot.send_document(chat_id=target_user_id, document=file_id, caption=caption)
-            
-        elif message.audio:
-            file_id = message.audio.file_id
-            caption = message.caption or ""
-            await context.bot.send_audio(chat_id=target_user_id, audio=file_id, caption=caption)
-            
-        elif message.voice:
-            file_id = message.voice.file_id
-            await context.bot.send_voice(chat_id=target_user_id, voice=file_id)
-            
-        elif message.sticker:
-            file_id = message.sticker.file_id
-            await context.bot.send_sticker(chat_id=target_user_id, sticker=file_id)
-        
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error forwarding media to user: {e}")
-        return False
\ No newline at end of file
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List
+from dotenv import load_dotenv
+from telegram import Message
+
+# Load environment variables
+load_dotenv()
+# Seconds to wait for more items of an album after the latest one arrived
+MEDIA_GROUP_WINDOW = float(os.getenv('MEDIA_GROUP_WINDOW', 1.0))
+
+logger = logging.getLogger(__name__)
+
+class MediaGroupCollector:
+    """Collects the separate updates of an album (same media_group_id).
+
+    Telegram delivers each album item as its own update. Items are buffered
+    until no new item has arrived for `window` seconds, then the callback is
+    called once with all of them, ordered by message_id.
+    """
+
+    def __init__(self, window: float = MEDIA_GROUP_WINDOW):
+        self._window = window
+        self._groups: Dict[str, List[Message]] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+
+    def add(self, message: Message, on_complete: Callable[[List[Message]], Awaitable[None]]) -> bool:
+        """Buffer an album item; returns True if it started a new group"""
+        group_id = message.media_group_id
+        is_new = group_id not in self._groups
+        self._groups.setdefault(group_id, []).append(message)
+
+        # Restart the quiet-period timer on every item
+        timer = self._timers.pop(group_id, None)
+        if timer:
+            timer.cancel()
+        self._timers[group_id] = asyncio.get_running_loop().create_task(
+            self._complete_later(group_id, on_complete)
+        )
+        return is_new
+
+    def __contains__(self, group_id: str) -> bool:
+        """Whether items of this album are currently being buffered"""
+        return group_id in self._groups
+
+    async def _complete_later(self, group_id: str, on_complete):
+        await asyncio.sleep(self._window)
+        self._timers.pop(group_id, None)
+        messages = sorted(self._groups.pop(group_id, []), key=lambda m: m.message_id)
+        try:
+            await on_complete(messages)
+        except Exception as e:
+            logger.error(f"Error handling media group {group_id}: {e}")
+
+# Global media group collector instance
+media_group_collector = MediaGroupCollector()
@@ -9,22 +9,22 @@ from database import db_manager
 load_dotenv()
 OWNER_USER_ID = int(os.getenv('OWNER_USER_ID', 0))
 from .auth import is_owner
-from .keyboards import get_owner_keyboard, get_reply_block_keyboard, get_confirmation_keyboard
-from telegram import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from .keyboards import get_owner_keyboard, get_confirmation_keyboard
+from .broadcast import broadcast_engine
+from .media import has_media, relay_message
+from .media_group import media_group_collector
+from .channel import membership_cache
+from .formatting import format_user_info, format_sender_info, get_user_header
+from .owner_inbox import owner_inbox
+from .user_lists import build_user_list_page
+from telegram import ReplyKeyboardMarkup, KeyboardButton
 
 logger = logging.getLogger(__name__)
 
 async def ask_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE, target_user_id: int, message_type: str):
     """Request confirmation for sending message"""
     # Get target user information
-    username, first_name, last_name = await db_manager.get_user_info(target_user_id)
-    target_info = f"🆔 {target_user_id}"
-    if username:
-        target_info += f" | @{username}"
-    if first_name:
-        target_info += f" | {first_name}"
-    if last_name:
-        target_info += f" {last_name}"
+    target_info = await get_user_header(target_user_id)
     
     # Save message in context for later sending
     context.user_data['pending_message'] = {
@@ -56,6 +56,20 @@ async def handle_owner_message(update: Update, context: ContextTypes.DEFAULT_TYP
         await handle_user_message(update, context)
         return
     
+    # Handle media broadcast (single media or album)
+    if 'broadcast_mode' in context.user_data and has_media(update.message):
+        await handle_broadcast_media(update, context)
+        return
+    
+    # Non-text replies and sends (media, stickers, polls, ...) are confirmed like text
+    if has_media(update.message) and 'pending_message' not in context.user_data:
+        if 'replying_to' in context.user_data:
+            await ask_confirmation(update, context, context.user_data['replying_to'], "reply")
+            return
+        if 'sending_to_user' in context.user_data:
+            await ask_confirmation(update, context, context.user_data['sending_to_user'], "message")
+            return
+    
     # Handle owner menu buttons
     if update.message.text:
         message_text = update.message.text
@@ -118,59 +132,28 @@ async def handle_owner_message(update: Update, context: ContextTypes.DEFAULT_TYP
             return
             
         elif message_text == "🚫 Block list":
-            blocked_users = await db_manager.get_blocked_users()
-            if not blocked_users:
-                await update.message.reply_text("📋 No blocked users found.")
-            else:
-                blocked_list = "🚫 Blocked Users List:\n\n"
-                for user_id, username, first_name, last_name in blocked_users:
-                    user_info = f"🆔 {user_id}"
-                    if username:
-                        user_info += f" | @{username}"
-                    if first_name:
-                        user_info += f" | {first_name}"
-                    if last_name:
-                        user_info += f" {last_name}"
-                    blocked_list += f"• {user_info}\n"
-                
-                # Add unblock buttons
-                keyboard = []
-                for user_id, _, _, _ in blocked_users[:10]:  # Limited to 10 users
-                    keyboard.append([InlineKeyboardButton(f"🔓 Unblock {user_id}", callback_data=f"unblock_{user_id}")])
-                
-                reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
-                await update.message.reply_text(blocked_list, reply_markup=reply_markup)
+            text, reply_markup = await build_user_list_page(blocked_only=True)
+            await update.message.reply_text(text, reply_markup=reply_markup)
             return
             
         elif message_text == "👥 User list":
-            all_users = await db_manager.get_all_users()
-            if not all_users:
-                await update.message.reply_text("📋 No users registered.")
-            else:
-                users_list = "👥 All Users List:\n\n"
-                for user_id, username, first_name, last_name, _, is_blocked in all_users[:20]:  # Limited to 20 users
-                    user_info = f"🆔 {user_id}"
-                    if username:
-                        user_info += f" | @{username}"
-                    if first_name:
-                        user_info += f" | {first_name}"
-                    if last_name:
-                        user_info += f" {last_name}"
-                    
-                    status = "🚫 Blocked" if is_blocked else "✅ Active"
-                    users_list += f"• {user_info} - {status}\n"
-                
-                await update.message.reply_text(users_list)  # Without parse_mode
+            text, reply_markup = await build_user_list_page(blocked_only=False)
+            await update.message.reply_text(text, reply_markup=reply_markup)  # Without parse_mode
             return
             
         elif message_text == "📊 System statistics":
             stats = await db_manager.get_stats()
+            cache_stats = membership_cache.stats()
+            queue_depths = context.application.update_processor.queue_depths()
             stats_text = f"""📊 System Statistics:
 
 👥 Total Users: {stats['total_users']}
 ✅ Active Users: {stats['active_users']}
 🚫 Blocked Users: {stats['blocked_users']}
-💬 Total Messages: {stats['total_messages']}"""
+📵 Unreachable Users: {stats['unreachable_users']}
+💬 Total Messages: {stats['total_messages']}
+🔁 Membership cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses
+⏳ Users with queued updates: {len(queue_depths)} (deepest queue: {max(queue_depths.values(), default=0)})"""
             
             await update.message.reply_text(stats_text)  # Without parse_mode
             return
@@ -202,14 +185,7 @@ async def handle_owner_message(update: Update, context: ContextTypes.DEFAULT_TYP
                 # Display user information
                 user_info = await db_manager.get_user_info(target_user_id)
                 if user_info:
-                    username, first_name, last_name = user_info
-                    target_info = f"🆔 {target_user_id}"
-                    if username:
-                        target_info += f" | @{username}"
-                    if first_name:
-                        target_info += f" | {first_name}"
-                    if last_name:
-                        target_info += f" {last_name}"
+                    target_info = format_user_info(target_user_id, *user_info)
                     
                     await update.message.reply_text(
                         f"📝 Sending message to:\n{target_info}\n\nPlease enter your message:",
@@ -237,64 +213,49 @@ async def handle_owner_message(update: Update, context: ContextTypes.DEFAULT_TYP
                 await update.message.reply_text("🚫 Broadcast cancelled.", reply_markup=get_owner_keyboard())
                 return
             
-            # Send broadcast message
-            all_users = await db_manager.get_all_users()
-            active_users = [user for user in all_users if not user[5]]  # Non-blocked users (is_blocked at index 5)
-            
-            success_count = 0
-            fail_count = 0
-            
-            progress_message = await update.message.reply_text("📤 Sending broadcast message...")
-            
-            for user_id, _, _, _, _, _ in active_users:  # 6 values: user_id, username, first_name, last_name, join_date, is_blocked
-                try:
-                    await context.bot.send_message(chat_id=user_id, text=message_text)
-                    success_count += 1
-                except Exception as e:
-                    fail_count += 1
-                    logger.error(f"Failed to send broadcast to {user_id}: {e}")
-            
-            context.user_data.pop('broadcast_mode', None)
-            
-            await progress_message.edit_text(
-                f"✅ Broadcast completed!\n\n" +
-                f"📤 Successful sends: {success_count}\n" +
-                f"❌ Failed sends: {fail_count}"
-            )
-            
-            await update.message.reply_text("Return to main menu", reply_markup=get_owner_keyboard())
+            await start_broadcast(context, update.effective_chat.id, text=message_text)
             return
 
+async def start_broadcast(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str = None, message_ids: list = None):
+    """Hand a broadcast to the background engine so the owner gets the menu back right away"""
+    progress_message = await context.bot.send_message(chat_id=chat_id, text="📤 Sending broadcast message...")
+    started = await broadcast_engine.start(
+        context.bot, chat_id, progress_message.message_id, text=text, source_message_ids=message_ids
+    )
+    if not started:
+        await progress_message.edit_text("❌ Error starting broadcast. Please try again later.")
+    
+    context.user_data.pop('broadcast_mode', None)
+    
+    await context.bot.send_message(chat_id=chat_id, text="Return to main menu", reply_markup=get_owner_keyboard())
+
+async def handle_broadcast_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Broadcast owner media by copying the uploaded message(s) to every recipient"""
+    message = update.message
+    
+    if message.media_group_id:
+        # Album items arrive as separate updates; broadcast them together once all have arrived
+        async def broadcast_album(messages):
+            await start_broadcast(context, message.chat_id, message_ids=[m.message_id for m in messages])
+        
+        media_group_collector.add(message, broadcast_album)
+        return
+    
+    await start_broadcast(context, message.chat_id, message_ids=[message.message_id])
+
 async def handle_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle regular user messages"""
     user = update.effective_user
     
-    # Check if user is blocked
-    is_blocked = await db_manager.is_user_blocked(user.id)
-    if is_blocked:
-        await update.message.reply_text("❌ You have been blocked by the bot owner and cannot send messages.")
-        return
+    # Blocked users never get here: main.py drops them in handler group -1
     
     if update.message.text:
-        sender_info = f"👤 Sender: ID {user.id}"
-        if user.username:
-            sender_info += f" | @{user.username}"
-        if user.first_name:
-            sender_info += f" | {user.first_name}"
-        if user.last_name:
-            sender_info += f" {user.last_name}"
-        
-        full_message = f"{sender_info}\n\n{update.message.text}"
+        sender_info = format_sender_info(user)
         
         await db_manager.save_message(user.id, update.message.text)
         
-        reply_markup = get_reply_block_keyboard(user.id)
-        
-        await context.bot.send_message(
-            chat_id=OWNER_USER_ID,
-            text=full_message,
-            reply_markup=reply_markup
-        )
+        # Paced (and bundled into digests under load) to stay within the owner chat's limit
+        owner_inbox.deliver_text(context.bot, user.id, sender_info, update.message.text)
         
         await update.message.reply_text("✅ Your message has been sent successfully!")
 
@@ -309,88 +270,13 @@ async def send_pending_message(update: Update, context: ContextTypes.DEFAULT_TYP
     is_reply = 'replying_to' in context.user_data
     
     try:
-        # Send message based on its type
-        if message.text:
-            if is_reply:
-                # Add admin reply header only for replies
-                admin_reply_text = f"`📝 Admin Reply:`\n\n{message.text}"
-                await context.bot.send_message(chat_id=target_user_id, text=admin_reply_text, parse_mode='Markdown')
-            else:
-                # Normal send without header
-                await context.bot.send_message(chat_id=target_user_id, text=message.text)
-        elif message.photo:
-            original_caption = message.caption or ""
-            if is_reply:
-                new_caption = f"`📝 Admin Reply:`\n\n{original_caption}" if original_caption else "`📝 Admin Reply:`"
-                parse_mode = 'Markdown'
-            else:
-                new_caption = original_caption
-                parse_mode = None
-            await context.bot.send_photo(
-                chat_id=target_user_id,
-                photo=message.photo[-1].file_id,
-                caption=new_caption,
-                parse_mode=parse_mode
-            )
-        elif message.video:
-            original_caption = message.caption or ""
-            if is_reply:
-                new_caption = f"`📝 Admin Reply:`\n\n{original_caption}" if original_caption else "`📝 Admin Reply:`"
-                parse_mode = 'Markdown'
-            else:
-                new_caption = original_caption
-                parse_mode = None
-            await context.bot.send_video(
-                chat_id=target_user_id,
-                video=message.video.file_id,
-                caption=new_caption,
-                parse_mode=parse_mode
-            )
-        elif message.document:
-            original_caption = message.caption or ""
-            if is_reply:
-                new_caption = f"`📝 Admin Reply:`\n\n{original_caption}" if original_caption else "`📝 Admin Reply:`"
-                parse_mode = 'Markdown'
-            else:
-                new_caption = original_caption
-                parse_mode = None
-            await context.bot.send_document(
-                chat_id=target_user_id,
-                document=message.document.file_id,
-                caption=new_caption,
-                parse_mode=parse_mode
-            )
-        elif message.audio:
-            original_caption = message.caption or ""
-            if is_reply:
-                new_caption = f"`📝 Admin Reply:`\n\n{original_caption}" if original_caption else "`📝 Admin Reply:`"
-                parse_mode = 'Markdown'
-            else:
-                new_caption = original_caption
-                parse_mode = None
-            await context.bot.send_audio(
-                chat_id=target_user_id,
-                audio=message.audio.file_id,
-                caption=new_caption,
-                parse_mode=parse_mode
-            )
-        elif message.voice:
-            if is_reply:
-                # For voice, send separate message
-                await context.bot.send_message(chat_id=target_user_id, text="`📝 Admin Reply:`", parse_mode='Markdown')
-            await context.bot.send_voice(
-                chat_id=target_user_id,
-                voice=message.voice.file_id,
-                caption=message.caption
-            )
-        elif message.sticker:
-            if is_reply:
-                # For sticker, send separate message
-                await context.bot.send_message(chat_id=target_user_id, text="`📝 Admin Reply:`", parse_mode='Markdown')
-            await context.bot.send_sticker(
-                chat_id=target_user_id,
-                sticker=message.sticker.file_id
-            )
+        if is_reply:
+            # Add admin reply header only for replies
+            await relay_message(context.bot, message, target_user_id, header="`📝 Admin Reply:`",
+                                parse_mode='Markdown', header_label="📝 Admin Reply")
+        else:
+            # Normal send without header
+            await relay_message(context.bot, message, target_user_id)
         
         # Clear temporary data
         context.user_data.pop('pending_message', None)
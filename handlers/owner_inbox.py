@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Awaitable, Callable, Optional, Tuple
+from dotenv import load_dotenv
+from telegram import Bot
+from telegram.error import RetryAfter
+from rate_limit import TokenBucket
+from .keyboards import get_reply_block_keyboard, get_digest_keyboard
+
+# Load environment variables
+load_dotenv()
+OWNER_USER_ID = int(os.getenv('OWNER_USER_ID', 0))
+# Telegram allows about one message per second into a single chat, with short bursts
+OWNER_CHAT_RATE = float(os.getenv('OWNER_CHAT_RATE', 1))
+OWNER_CHAT_BURST = float(os.getenv('OWNER_CHAT_BURST', 3))
+# Pending text messages that switch delivery from one-by-one to digests
+OWNER_DIGEST_THRESHOLD = int(os.getenv('OWNER_DIGEST_THRESHOLD', 3))
+OWNER_DIGEST_MAX_MESSAGES = 20
+# Leave room under Telegram's 4096 character limit
+OWNER_DIGEST_MAX_LENGTH = 3800
+OWNER_DIGEST_ITEM_LENGTH = 500
+OWNER_INBOX_DRAIN_TIMEOUT = 10
+# A text or digest that fails for another reason than flood control is retried after a pause
+OWNER_SEND_RETRIES = 3
+OWNER_RETRY_DELAY = 5
+
+logger = logging.getLogger(__name__)
+
+class OwnerInbox:
+    """Paced delivery queue for everything sent to the owner's chat.
+
+    At low volume each user message is sent on its own with its reply/block
+    keyboard. When messages arrive faster than OWNER_CHAT_RATE and text
+    messages pile up, they are bundled into digest messages with one pair of
+    reply/block buttons per sender. Every send takes a token from the
+    per-chat bucket, so the owner chat stays under Telegram's limit.
+    Senders are told "sent" before delivery, so failed texts and digests are
+    retried rather than dropped.
+    """
+
+    def __init__(self, rate: float = OWNER_CHAT_RATE, burst: float = OWNER_CHAT_BURST):
+        self._limiter = TokenBucket(rate, burst)
+        self._queue: deque = deque()
+        self._failures = 0
+        self._callbacks: set = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._bot: Optional[Bot] = None
+
+    def _ensure_started(self, bot: Bot):
+        self._bot = bot
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def deliver_text(self, bot: Bot, user_id: int, sender_info: str, text: str):
+        """Queue a user's text message for the owner (digest-eligible)"""
+        self._ensure_started(bot)
+        self._queue.append(('text', user_id, sender_info, text))
+        self._wakeup.set()
+
+    def deliver(self, bot: Bot, *steps: Tuple[Callable[[], Awaitable], int],
+                on_done: Optional[Callable[[bool], Awaitable]] = None):
+        """Queue arbitrary sends to the owner (e.g. media) without waiting for them.
+
+        Each step is a (send, cost) pair, cost being the number of messages the
+        send puts into the owner chat (e.g. album items); it is charged against
+        the rate limit. Steps run in order and a finished step is never repeated
+        when a later one hits flood control; a failed step cancels the rest.
+        `on_done(delivered)` is awaited in its own task once the steps finish.
+        """
+        self._ensure_started(bot)
+        self._queue.append(('call', deque(steps), on_done))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            head = self._queue[0]
+            cost = head[1][0][1] if head[0] == 'call' else 1
+            # A send can cost more than a full bucket (e.g. a 10 item album): charge it in bucket-sized parts
+            while cost > 0:
+                part = min(cost, self._limiter.capacity)
+                await self._limiter.acquire(part)
+                cost -= part
+            await self._send_next()
+
+    async def _send_next(self):
+        head = self._queue[0]
+        if head[0] == 'call':
+            _, steps, on_done = head
+            delivered = await self._attempt(steps[0][0])
+            if delivered:
+                steps.popleft()
+            if delivered is False or (delivered and not steps):
+                self._queue.popleft()
+                if on_done is not None:
+                    task = asyncio.get_running_loop().create_task(self._run_callback(on_done, delivered))
+                    self._callbacks.add(task)
+                    task.add_done_callback(self._callbacks.discard)
+        elif self._digest_ready():
+            items = self._take_digest_items()
+            delivered = await self._attempt(lambda: self._send_digest(items))
+            if delivered:
+                self._failures = 0
+            elif delivered is None or self._should_retry():
+                self._queue.extendleft(reversed(items))
+            else:
+                senders = sorted({item[1] for item in items})
+                logger.error(f"Dropped a digest of {len(items)} messages from users {senders} "
+                             f"after {OWNER_SEND_RETRIES} retries")
+        else:
+            _, user_id, sender_info, text = head
+            delivered = await self._attempt(lambda: self._bot.send_message(
+                chat_id=OWNER_USER_ID,
+                text=f"{sender_info}\n\n{text}",
+                reply_markup=get_reply_block_keyboard(user_id)
+            ))
+            if delivered is None or (delivered is False and self._should_retry()):
+                return
+            if delivered:
+                self._failures = 0
+            else:
+                logger.error(f"Dropped a message from user {user_id} after {OWNER_SEND_RETRIES} retries")
+            self._queue.popleft()
+
+    def _digest_ready(self) -> bool:
+        """Whether at least OWNER_DIGEST_THRESHOLD texts sit next to each other at the head of the queue"""
+        adjacent = 0
+        for item in self._queue:
+            # Texts queued behind media cannot join this digest, so they do not count
+            if item[0] != 'text':
+                return False
+            adjacent += 1
+            if adjacent >= OWNER_DIGEST_THRESHOLD:
+                return True
+        return False
+
+    def _should_retry(self) -> bool:
+        """After a failed text or digest: pause and retry, up to OWNER_SEND_RETRIES times in a row"""
+        self._failures += 1
+        if self._failures > OWNER_SEND_RETRIES:
+            self._failures = 0
+            return False
+        self._limiter.pause(OWNER_RETRY_DELAY)
+        return True
+
+    @staticmethod
+    async def _run_callback(on_done: Callable[[bool], Awaitable], delivered: bool):
+        try:
+            await on_done(delivered)
+        except Exception as e:
+            logger.error(f"Error after delivering to owner: {e}")
+
+    async def _attempt(self, send: Callable[[], Awaitable]) -> Optional[bool]:
+        """Run one send; None means flood control was hit and it should stay queued"""
+        try:
+            await send()
+            return True
+        except RetryAfter as e:
+            # Hold all owner sends until Telegram allows more
+            logger.warning(f"Owner chat hit flood control, pausing {e.retry_after}s")
+            self._limiter.pause(e.retry_after)
+            return None
+        except Exception as e:
+            logger.error(f"Error delivering message to owner: {e}")
+            return False
+
+    def _take_digest_items(self) -> list:
+        """Remove queued text messages for one digest, stopping at the first non-text item"""
+        items = []
+        length = 0
+        while self._queue and self._queue[0][0] == 'text' and len(items) < OWNER_DIGEST_MAX_MESSAGES:
+            text = self._queue[0][3]
+            if len(text) > OWNER_DIGEST_ITEM_LENGTH:
+                text = text[:OWNER_DIGEST_ITEM_LENGTH] + "…"
+            length += len(self._queue[0][2]) + len(text) + 10
+            if items and length > OWNER_DIGEST_MAX_LENGTH:
+                break
+            _, user_id, sender_info, original_text = self._queue.popleft()
+            items.append(('text', user_id, sender_info, original_text))
+        return items
+
+    async def _send_digest(self, items: list):
+        """One message bundling several senders' texts, with per-sender buttons"""
+        senders = {}
+        for _, user_id, sender_info, text in items:
+            if len(text) > OWNER_DIGEST_ITEM_LENGTH:
+                text = text[:OWNER_DIGEST_ITEM_LENGTH] + "…"
+            senders.setdefault(user_id, (sender_info, []))[1].append(text)
+
+        digest = f"📬 {len(items)} new messages\n"
+        for number, (sender_info, texts) in enumerate(senders.values(), start=1):
+            digest += f"\n[{number}] {sender_info}\n"
+            for text in texts:
+                digest += f"• {text}\n"
+
+        await self._bot.send_message(
+            chat_id=OWNER_USER_ID,
+            text=digest,
+            reply_markup=get_digest_keyboard(list(senders))
+        )
+
+    async def shutdown(self):
+        """Try to deliver what is still queued, then stop"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), OWNER_INBOX_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Owner inbox stopped with {len(self._queue)} undelivered messages")
+        self._task.cancel()
+        await asyncio.gather(self._task, *self._callbacks, return_exceptions=True)
+        self._task = None
+
+    async def _drain(self):
+        while self._queue:
+            await asyncio.sleep(0.1)
+
+# Global owner inbox instance
+owner_inbox = OwnerInbox()
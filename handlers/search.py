@@ -0,0 +1,47 @@
+import logging
+from typing import Optional, Tuple
+from telegram import InlineKeyboardMarkup, Update
+from telegram.ext import ContextTypes
+from database import db_manager
+from .auth import is_owner
+from .formatting import format_user_info
+from .keyboards import get_search_keyboard
+
+SEARCH_PAGE_SIZE = 10
+
+logger = logging.getLogger(__name__)
+
+async def build_search_page(terms: str, page: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Text and navigation keyboard for one page of search results"""
+    # One extra row tells whether there is a next page without counting all hits
+    hits = await db_manager.search_messages(terms, SEARCH_PAGE_SIZE + 1, page * SEARCH_PAGE_SIZE)
+    has_next = len(hits) > SEARCH_PAGE_SIZE
+    hits = hits[:SEARCH_PAGE_SIZE]
+    
+    if not hits:
+        if page == 0:
+            return f"🔎 No messages found for: {terms}", None
+        return f"🔎 No more results for: {terms}", get_search_keyboard(page, False)
+    
+    text = f"🔎 Results for: {terms} (page {page + 1})\n"
+    for number, hit in enumerate(hits, start=page * SEARCH_PAGE_SIZE + 1):
+        sender = format_user_info(hit['user_id'], hit['username'], hit['first_name'], hit['last_name'])
+        timestamp = (hit['timestamp'] or '')[:16].replace('T', ' ')
+        text += f"\n{number}. {sender}\n🕒 {timestamp}\n💬 {hit['snippet']}\n"
+    
+    return text, get_search_keyboard(page, has_next)
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Full-text search over archived messages (owner only): /search <terms>"""
+    if not is_owner(update.effective_user.id):
+        return
+    
+    terms = ' '.join(context.args)
+    if not terms:
+        await update.message.reply_text("🔎 Usage: /search <words>\n\nExample: /search order refund")
+        return
+    
+    # Page buttons read the query from here
+    context.user_data['search_query'] = terms
+    text, reply_markup = await build_search_page(terms, 0)
+    await update.message.reply_text(text, reply_markup=reply_markup)
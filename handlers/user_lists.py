@@ -0,0 +1,60 @@
+import logging
+from typing import Optional, Tuple
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from database import db_manager
+from .formatting import format_user_info
+from .keyboards import get_list_navigation_row
+
+USER_LIST_PAGE_SIZE = 20
+# One unblock button per user, so keep block list pages short
+BLOCK_LIST_PAGE_SIZE = 10
+
+logger = logging.getLogger(__name__)
+
+async def build_user_list_page(blocked_only: bool, action: str = 'f', page: int = 0,
+                               cursor_user_id: Optional[int] = None) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """One page of the user list or block list.
+
+    action is 'f' (first page), 'n' (page after cursor_user_id), 'p' (page
+    before cursor_user_id) or 'l' (last page). Totals come from the stats
+    counters, so building a page never scans the users table.
+    """
+    prefix = 'bl' if blocked_only else 'ul'
+    page_size = BLOCK_LIST_PAGE_SIZE if blocked_only else USER_LIST_PAGE_SIZE
+    totals = await db_manager.get_user_totals()
+    total = totals['blocked_users'] if blocked_only else totals['total_users']
+    pages = max(1, -(-total // page_size))
+    
+    if action == 'n':
+        rows = await db_manager.get_users_page(blocked_only, after_user_id=cursor_user_id, limit=page_size)
+    elif action == 'p':
+        rows = await db_manager.get_users_page(blocked_only, before_user_id=cursor_user_id, limit=page_size)
+    elif action == 'l':
+        page = pages - 1
+        rows = await db_manager.get_users_page(blocked_only, from_end=True,
+                                               limit=total - page * page_size or page_size)
+    else:
+        page = 0
+        rows = await db_manager.get_users_page(blocked_only, limit=page_size)
+    page = min(page, pages - 1)
+    
+    if not rows:
+        return ("📋 No blocked users found." if blocked_only else "📋 No users registered."), None
+    
+    if blocked_only:
+        text = f"🚫 Blocked Users List ({total}):\n\n"
+    else:
+        text = f"👥 All Users List ({total}):\n\n"
+    keyboard = []
+    for user_id, username, first_name, last_name, _, is_blocked in rows:
+        user_info = format_user_info(user_id, username, first_name, last_name)
+        if blocked_only:
+            text += f"• {user_info}\n"
+            keyboard.append([InlineKeyboardButton(f"🔓 Unblock {user_id}", callback_data=f"unblock_{user_id}")])
+        else:
+            status = "🚫 Blocked" if is_blocked else "✅ Active"
+            text += f"• {user_info} - {status}\n"
+    
+    if pages > 1:
+        keyboard.append(get_list_navigation_row(prefix, page, pages, rows[0][0], rows[-1][0]))
+    return text, InlineKeyboardMarkup(keyboard) if keyboard else None
@@ -1,16 +1,43 @@
 import logging
 import os
+from typing import Optional
 from dotenv import load_dotenv
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-from handlers.commands import start
+from telegram import Update
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, filters
+from telegram.request import BaseRequest
+from handlers.commands import start, recount_stats
 
 # Load environment variables
 load_dotenv()
 API_TOKEN = os.getenv('API_TOKEN')
+# Update delivery: 'polling' (default) or 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Public base URL Telegram posts to, e.g. https://bot.example.com
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'webhook').strip('/')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+# Maximum simultaneous HTTPS connections Telegram opens to deliver updates
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+# Inbound flood control per user: sustained messages per second, burst, cooldown between
+# "slow down" notices, and notices before an automatic block (0 disables auto-block)
+FLOOD_RATE = float(os.getenv('FLOOD_RATE', 0.5))
+FLOOD_BURST = float(os.getenv('FLOOD_BURST', 5))
+FLOOD_COOLDOWN = float(os.getenv('FLOOD_COOLDOWN', 30))
+FLOOD_BLOCK_AFTER = int(os.getenv('FLOOD_BLOCK_AFTER', 0))
 from handlers.messages import handle_owner_message
 from handlers.callbacks import handle_callback
-from handlers.media import forward_media_to_owner
-from handlers.auth import is_owner
+from handlers.media import forward_media_to_owner, has_media
+from handlers.media_group import media_group_collector
+from handlers.search import search
+from handlers.auth import is_owner, drop_blocked_users
+from database import db_manager
+from handlers.broadcast import broadcast_engine
+from handlers.owner_inbox import owner_inbox
+from update_processor import PerUserUpdateProcessor
+from rate_limit import FloodControl
+from persistence import SQLitePersistence
+from retention import message_archiver
 
 # Log settings
 logging.basicConfig(
@@ -19,15 +46,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+flood_control = FloodControl(FLOOD_RATE, FLOOD_BURST, FLOOD_COOLDOWN, FLOOD_BLOCK_AFTER)
+
 async def handle_message(update, context):
     """General message handling"""
     user = update.effective_user
     
-    # Check media
-    if (update.message.photo or update.message.video or 
-        update.message.document or update.message.audio or 
-        update.message.voice or update.message.sticker):
+    if not is_owner(user.id):
+        # Flood control runs before any database or API work; an album counts once
+        group_id = update.message.media_group_id
+        if group_id and group_id in media_group_collector:
+            verdict = FloodControl.ALLOW
+        else:
+            verdict = flood_control.check(user.id)
+        if verdict == FloodControl.NOTIFY:
+            await update.message.reply_text("⏳ You are sending messages too fast. Please slow down.")
+            return
+        if verdict == FloodControl.DROP:
+            return
+        if verdict == FloodControl.BLOCK:
+            logger.warning(f"Blocking user {user.id} for repeated flooding")
+            # The user may never have run /start; block_user stores them with this profile
+            db_manager.remember_user(user.id, user.username, user.first_name, user.last_name)
+            await db_manager.block_user(user.id)
+            await update.message.reply_text("❌ You have been blocked by the bot owner and cannot send messages.")
+            return
         
+        # Keep the sender's profile warm for the owner's reply/block flows
+        db_manager.remember_user(user.id, user.username, user.first_name, user.last_name)
+        # A message from a user marked unreachable means we can deliver to them again
+        await db_manager.mark_user_reachable(user.id)
+    
+    # Check media
+    if has_media(update.message):
         if not is_owner(user.id):
             await forward_media_to_owner(update, context, user)
         else:
@@ -36,19 +87,71 @@ async def handle_message(update, context):
         # Text message
         await handle_owner_message(update, context)
 
-def main():
-    """Main function to start the bot"""
-    # Create Application
-    application = Application.builder().token(API_TOKEN).build()
+async def on_startup(application):
+    """Resume background work interrupted by the last shutdown"""
+    await broadcast_engine.resume(application.bot)
+    db_manager.start_search_backfill()
+    message_archiver.start()
+
+async def on_stop(application):
+    """Stop background jobs before the bot is shut down"""
+    await broadcast_engine.shutdown()
+    await owner_inbox.shutdown()
+    await message_archiver.shutdown()
+
+async def on_shutdown(application):
+    """Release resources when the application stops"""
+    await db_manager.close()
+
+def build_application(token: str = API_TOKEN, request: Optional[BaseRequest] = None) -> Application:
+    """The bot with all handlers registered; `request` replaces the HTTP transport to the Bot API"""
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(PerUserUpdateProcessor())
+        # Keep pending replies and confirmations across restarts
+        .persistence(SQLitePersistence())
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
+    
+    # Drop blocked users before any other handler or database work (group -1 runs first)
+    application.add_handler(TypeHandler(Update, drop_blocked_users), group=-1)
     
     # Add handlers
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("recount_stats", recount_stats))
+    application.add_handler(CommandHandler("search", search))
     application.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, handle_message))
     application.add_handler(CallbackQueryHandler(handle_callback))
+    return application
+
+def main():
+    """Main function to start the bot"""
+    application = build_application()
     
     # Start bot
-    logger.info("Bot is starting...")
-    application.run_polling()
+    if BOT_MODE == 'webhook':
+        if not WEBHOOK_URL or not WEBHOOK_SECRET:
+            raise RuntimeError("Webhook mode requires WEBHOOK_URL and WEBHOOK_SECRET")
+        logger.info(f"Bot is starting in webhook mode on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}...")
+        # Requests without the matching X-Telegram-Bot-Api-Secret-Token header are rejected
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        logger.info("Bot is starting...")
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,280 @@
+import logging
+import sqlite3
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+def _initial_schema(conn: sqlite3.Connection):
+    """Base tables plus the secondary indexes used by lookups and listings"""
+    # Users table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            join_date TEXT,
+            is_blocked INTEGER DEFAULT 0
+        )
+    ''')
+    
+    # Messages table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            message TEXT,
+            timestamp TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    
+    # Username lookups (send to @username)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users (username)')
+    # Block list and active/blocked listings ordered by join date
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_blocked_join_date ON users (is_blocked, join_date)')
+    # Per-user message history
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_user_id ON messages (user_id, id)')
+
+def _stats_counters(conn: sqlite3.Connection):
+    """Single-row statistics counters kept exact by triggers"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_users INTEGER NOT NULL DEFAULT 0,
+            blocked_users INTEGER NOT NULL DEFAULT 0,
+            total_messages INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO stats_counters (id) VALUES (1)')
+    recount_stats(conn)
+    
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_insert_stats AFTER INSERT ON users
+        BEGIN
+            UPDATE stats_counters SET total_users = total_users + 1,
+                blocked_users = blocked_users + (NEW.is_blocked = 1)
+            WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_delete_stats AFTER DELETE ON users
+        BEGIN
+            UPDATE stats_counters SET total_users = total_users - 1,
+                blocked_users = blocked_users - (OLD.is_blocked = 1)
+            WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_block_stats AFTER UPDATE OF is_blocked ON users
+        WHEN OLD.is_blocked IS NOT NEW.is_blocked
+        BEGIN
+            UPDATE stats_counters
+            SET blocked_users = blocked_users + (NEW.is_blocked = 1) - (OLD.is_blocked = 1)
+            WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_messages_insert_stats AFTER INSERT ON messages
+        BEGIN
+            UPDATE stats_counters SET total_messages = total_messages + 1 WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_messages_delete_stats AFTER DELETE ON messages
+        BEGIN
+            UPDATE stats_counters SET total_messages = total_messages - 1 WHERE id = 1;
+        END
+    ''')
+
+def _broadcast_jobs(conn: sqlite3.Connection):
+    """Persistent broadcast job state so an interrupted job can resume"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            progress_message_id INTEGER,
+            text TEXT,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            success_count INTEGER NOT NULL DEFAULT 0,
+            fail_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT,
+            finished_at TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs (status)')
+
+def _broadcast_media(conn: sqlite3.Connection):
+    """Media broadcasts copy the owner's original message(s) instead of storing text"""
+    conn.execute('ALTER TABLE broadcast_jobs ADD COLUMN source_chat_id INTEGER')
+    conn.execute('ALTER TABLE broadcast_jobs ADD COLUMN source_message_ids TEXT')
+
+def _delivery_status(conn: sqlite3.Connection):
+    """Track recipients the bot can no longer reach (blocked the bot, deleted account)"""
+    conn.execute("ALTER TABLE users ADD COLUMN delivery_status TEXT NOT NULL DEFAULT 'ok'")
+    conn.execute('ALTER TABLE users ADD COLUMN unreachable_since TEXT')
+    
+    # Unreachable users that are not blocked (blocked users are already excluded from fan-out)
+    conn.execute('ALTER TABLE stats_counters ADD COLUMN unreachable_users INTEGER NOT NULL DEFAULT 0')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_insert_unreachable_stats AFTER INSERT ON users
+        WHEN NEW.delivery_status != 'ok' AND NEW.is_blocked = 0
+        BEGIN
+            UPDATE stats_counters SET unreachable_users = unreachable_users + 1 WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_delete_unreachable_stats AFTER DELETE ON users
+        WHEN OLD.delivery_status != 'ok' AND OLD.is_blocked = 0
+        BEGIN
+            UPDATE stats_counters SET unreachable_users = unreachable_users - 1 WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_unreachable_stats
+        AFTER UPDATE OF is_blocked, delivery_status ON users
+        BEGIN
+            UPDATE stats_counters
+            SET unreachable_users = unreachable_users
+                + (NEW.delivery_status != 'ok' AND NEW.is_blocked = 0)
+                - (OLD.delivery_status != 'ok' AND OLD.is_blocked = 0)
+            WHERE id = 1;
+        END
+    ''')
+
+def _user_data(conn: sqlite3.Connection):
+    """Conversation state (context.user_data), one pickled value per key"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_data (
+            user_id INTEGER NOT NULL,
+            key TEXT NOT NULL,
+            value BLOB NOT NULL,
+            PRIMARY KEY (user_id, key)
+        ) WITHOUT ROWID
+    ''')
+
+def _messages_fts(conn: sqlite3.Connection):
+    """Full-text index over message text (external content, so the text is not stored twice).
+
+    Triggers index new messages right away. Messages that existed before this
+    migration (id <= search_index_state.backfill_cursor) are indexed in the
+    background from newest to oldest, so the migration itself stays instant.
+    """
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            message,
+            content='messages',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_index_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            backfill_cursor INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO search_index_state (id, backfill_cursor)
+        VALUES (1, (SELECT COALESCE(MAX(id), 0) FROM messages))
+    ''')
+    
+    # Rows at or below the cursor are not indexed yet, so they must not be removed from the index
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fts_insert AFTER INSERT ON messages
+        BEGIN
+            INSERT INTO messages_fts (rowid, message) VALUES (NEW.id, NEW.message);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fts_delete AFTER DELETE ON messages
+        WHEN OLD.id > (SELECT backfill_cursor FROM search_index_state WHERE id = 1)
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message) VALUES ('delete', OLD.id, OLD.message);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fts_update AFTER UPDATE OF message ON messages
+        WHEN OLD.id > (SELECT backfill_cursor FROM search_index_state WHERE id = 1)
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message) VALUES ('delete', OLD.id, OLD.message);
+            INSERT INTO messages_fts (rowid, message) VALUES (NEW.id, NEW.message);
+        END
+    ''')
+
+def _users_join_date_index(conn: sqlite3.Connection):
+    """Keyset pagination of the user list by (join_date, user_id)"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_join_date ON users (join_date)')
+
+def _archived_messages(conn: sqlite3.Connection):
+    """Messages moved out to archive segments still count towards the message total"""
+    conn.execute('ALTER TABLE stats_counters ADD COLUMN archived_messages INTEGER NOT NULL DEFAULT 0')
+
+def _archived_ranges(conn: sqlite3.Connection):
+    """Which archive segments hold a user's messages, so history reads only those"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archived_ranges (
+            user_id INTEGER NOT NULL,
+            segment TEXT NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, segment)
+        ) WITHOUT ROWID
+    ''')
+
+# Ordered (version, migration) pairs; append new entries, never edit applied ones
+MIGRATIONS: List[Tuple[int, Callable[[sqlite3.Connection], None]]] = [
+    (1, _initial_schema),
+    (2, _stats_counters),
+    (3, _broadcast_jobs),
+    (4, _broadcast_media),
+    (5, _delivery_status),
+    (6, _user_data),
+    (7, _messages_fts),
+    (8, _users_join_date_index),
+    (9, _archived_messages),
+    (10, _archived_ranges),
+]
+
+def recount_stats(conn: sqlite3.Connection):
+    """Recompute the statistics counters from scratch (full scans)"""
+    conn.execute('''
+        UPDATE stats_counters SET
+            total_users = (SELECT COUNT(*) FROM users),
+            blocked_users = (SELECT COUNT(*) FROM users WHERE is_blocked = 1),
+            total_messages = (SELECT COUNT(*) FROM messages)
+        WHERE id = 1
+    ''')
+    # Migration 2 runs this before migration 5 adds delivery_status and unreachable_users
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(stats_counters)')}
+    if 'unreachable_users' in columns:
+        conn.execute('''
+            UPDATE stats_counters SET
+                unreachable_users = (SELECT COUNT(*) FROM users
+                                     WHERE delivery_status != 'ok' AND is_blocked = 0)
+            WHERE id = 1
+        ''')
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Current schema version stored in PRAGMA user_version"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations, each in its own transaction, and return the new version"""
+    version = get_schema_version(conn)
+    for target, migration in MIGRATIONS:
+        if target <= version:
+            continue
+        try:
+            conn.execute('BEGIN')
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {target}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            logger.error(f"Migration to schema version {target} failed")
+            raise
+        logger.info(f"Database schema migrated: version {version} -> {target}")
+        version = target
+    return version
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import pickle
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from telegram.ext import BasePersistence, PersistenceInput
+from database import db_manager
+
+# Load environment variables
+load_dotenv()
+# Seconds between writes of changed conversation state
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv('PERSISTENCE_FLUSH_INTERVAL', 5))
+
+logger = logging.getLogger(__name__)
+
+class SQLitePersistence(BasePersistence):
+    """Stores context.user_data in the bot's SQLite database, one row per key.
+
+    Nothing is loaded at startup except the IDs of users that have stored
+    state; a user's data is read the first time one of their updates is
+    handled. On each persistence run (every `update_interval` seconds) values
+    are pickled and compared with what was last written, and only changed or
+    removed keys are written, for all users in a single transaction.
+    """
+
+    def __init__(self, update_interval: float = PERSISTENCE_FLUSH_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self._stored_ids: set = set()
+        self._loaded_ids: set = set()
+        # user_id -> {key: pickled value} as last written
+        self._stored: Dict[int, Dict[str, bytes]] = {}
+        self._pending: Dict[int, Tuple[Dict[str, bytes], List[str], Dict[str, bytes]]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        self._stored_ids = await db_manager.get_user_data_ids()
+        logger.info(f"Persisted conversation state found for {len(self._stored_ids)} users")
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        """Load a user's stored state the first time it is needed"""
+        if user_id not in self._stored_ids or user_id in self._loaded_ids:
+            return
+        self._loaded_ids.add(user_id)
+        stored = await db_manager.load_user_data(user_id)
+        for key, value in stored.items():
+            try:
+                user_data.setdefault(key, pickle.loads(value))
+            except Exception as e:
+                logger.error(f"Discarding unreadable user data {key!r} of {user_id}: {e}")
+        self._stored[user_id] = stored
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        stored = self._stored.get(user_id, {})
+        current = {}
+        changed = {}
+        for key, value in data.items():
+            if not isinstance(key, str):
+                logger.warning(f"Not persisting user data key {key!r} of {user_id}: keys must be strings")
+                continue
+            try:
+                blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                logger.warning(f"Not persisting user data {key!r} of {user_id}: {e}")
+                continue
+            current[key] = blob
+            if stored.get(key) != blob:
+                changed[key] = blob
+        removed = [key for key in stored if key not in current]
+        if not changed and not removed:
+            return
+
+        # Updates from one persistence run are gathered; commit them together
+        self._pending[user_id] = (changed, removed, current)
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_pending())
+        await asyncio.shield(self._flush_task)
+
+    async def _flush_pending(self):
+        pending, self._pending = self._pending, {}
+        self._flush_task = None
+        changes = {user_id: (changed, removed) for user_id, (changed, removed, _) in pending.items()}
+        if not await db_manager.save_user_data(changes):
+            return
+        for user_id, (_, _, current) in pending.items():
+            if current:
+                self._stored[user_id] = current
+                self._stored_ids.add(user_id)
+            else:
+                self._stored.pop(user_id, None)
+                self._stored_ids.discard(user_id)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._pending.pop(user_id, None)
+        if await db_manager.delete_user_data(user_id):
+            self._stored.pop(user_id, None)
+            self._stored_ids.discard(user_id)
+
+    async def flush(self) -> None:
+        if self._flush_task is not None:
+            await self._flush_task
+
+    # Only user_data is stored; chat, bot, callback and conversation data are not used
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state: Optional[object]) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
@@ -0,0 +1,110 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens if available right now, without waiting"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return False
+        self._refill(now)
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1):
+        """Wait until tokens are available (waiters are served in FIFO order)"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for `seconds` (e.g. after a RetryAfter from Telegram)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+class FloodControl:
+    """Per-user token buckets for inbound messages with bounded memory.
+
+    Buckets live in an LRU ordered by last use. A bucket idle long enough to
+    have refilled completely carries no state, so it is dropped; the table is
+    also capped at `max_users` entries.
+    """
+
+    ALLOW = 'allow'
+    NOTIFY = 'notify'  # First rejected message in a cooldown window: tell the user once
+    DROP = 'drop'      # Rejected silently
+    BLOCK = 'block'    # Repeat offender: escalate to a block
+
+    def __init__(self, rate: float, burst: float, cooldown: float,
+                 block_after: int = 0, max_users: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.cooldown = cooldown
+        self.block_after = block_after
+        self.max_users = max_users
+        self._idle_expiry = burst / rate + cooldown
+        # user_id -> [tokens, last_seen, notice_until, strikes]
+        self._buckets: OrderedDict = OrderedDict()
+
+    def check(self, user_id: int) -> str:
+        """Consume one message for user_id and return the verdict"""
+        now = time.monotonic()
+        self._expire(now)
+
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = [self.burst, now, 0.0, 0]
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return self.ALLOW
+
+        if now < bucket[2]:
+            return self.DROP
+        bucket[2] = now + self.cooldown
+        bucket[3] += 1
+        if self.block_after and bucket[3] >= self.block_after:
+            del self._buckets[user_id]
+            return self.BLOCK
+        return self.NOTIFY
+
+    def _expire(self, now: float):
+        while self._buckets:
+            user_id, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] < self._idle_expiry:
+                break
+            del self._buckets[user_id]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
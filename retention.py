@@ -0,0 +1,169 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from database import db_manager
+
+# Load environment variables
+load_dotenv()
+# Messages older than this many days move from the database to archive segments (0 disables retention)
+MESSAGE_RETENTION_DAYS = int(os.getenv('MESSAGE_RETENTION_DAYS', 0))
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', 5000))
+RETENTION_INTERVAL = 24 * 60 * 60
+
+logger = logging.getLogger(__name__)
+
+class MessageArchiver:
+    """Moves expired messages out of SQLite into compressed, date-partitioned segments.
+
+    Segments are append-only gzip JSONL files, one per message date
+    (messages-YYYY-MM-DD.jsonl.gz); every batch is appended as a new gzip
+    member and fsynced before the rows are deleted from the database, so a
+    crash can duplicate rows in the archive but never lose them. Readers skip
+    duplicate ids. The delete also records which segments hold each user's
+    messages (archived_ranges), so a user's history opens only those.
+    """
+
+    def __init__(self, archive_dir: str = ARCHIVE_DIR, retention_days: int = MESSAGE_RETENTION_DAYS):
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Run retention once a day in the background (no-op when retention is disabled)"""
+        if self.retention_days > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        if await db_manager.get_auto_vacuum_mode() != 2:
+            logger.warning("Database was created without auto_vacuum = INCREMENTAL; archived messages "
+                           "free pages for reuse but the file will not shrink until a one-time VACUUM")
+        while True:
+            try:
+                archived = await self.archive_expired()
+                if archived:
+                    logger.info(f"Archived {archived} messages older than {self.retention_days} days")
+            except Exception as e:
+                logger.error(f"Error archiving messages: {e}")
+            await asyncio.sleep(RETENTION_INTERVAL)
+
+    async def archive_expired(self) -> int:
+        """Archive and delete every message older than the retention period, batch by batch"""
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+        loop = asyncio.get_running_loop()
+        archived = 0
+        while True:
+            rows = await db_manager.get_expired_messages(cutoff, RETENTION_BATCH_SIZE)
+            if not rows:
+                break
+            await loop.run_in_executor(None, self._append_segments, rows)
+            archived += await db_manager.delete_archived_messages(rows[-1]['id'], self._user_ranges(rows))
+            # Pages freed by this batch go back to the file system right away, a bounded amount each time
+            await db_manager.reclaim_space()
+            if len(rows) < RETENTION_BATCH_SIZE:
+                break
+        return archived
+
+    def _segment_path(self, date: str) -> str:
+        return os.path.join(self.archive_dir, f"messages-{date}.jsonl.gz")
+
+    @staticmethod
+    def _segment_date(row: dict) -> str:
+        return (row['timestamp'] or '')[:10] or 'undated'
+
+    def _user_ranges(self, rows: List[dict]) -> List[Tuple[int, str, int, int]]:
+        """(user_id, segment date, first id, last id) of every user in an archived batch"""
+        ranges: Dict[Tuple[int, str], List[int]] = {}
+        for row in rows:
+            key = (row['user_id'], self._segment_date(row))
+            if key in ranges:
+                ranges[key][1] = row['id']
+            else:
+                ranges[key] = [row['id'], row['id']]
+        return [(user_id, date, first_id, last_id) for (user_id, date), (first_id, last_id) in ranges.items()]
+
+    def _append_segments(self, rows: List[dict]):
+        """Append rows to their date's segment and make them durable before they are deleted"""
+        by_date: Dict[str, List[dict]] = {}
+        for row in rows:
+            date = self._segment_date(row)
+            by_date.setdefault(date, []).append(row)
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for date, date_rows in by_date.items():
+            with open(self._segment_path(date), 'ab') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as segment:
+                    for row in date_rows:
+                        segment.write((json.dumps(row, ensure_ascii=False) + '\n').encode('utf-8'))
+                raw.flush()
+                os.fsync(raw.fileno())
+
+    def _segment_files(self, newest_first: bool = False) -> List[str]:
+        if not os.path.isdir(self.archive_dir):
+            return []
+        names = sorted(name for name in os.listdir(self.archive_dir)
+                       if name.startswith('messages-') and name.endswith('.jsonl.gz'))
+        return [os.path.join(self.archive_dir, name) for name in (reversed(names) if newest_first else names)]
+
+    def iter_archive(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Iterator[dict]:
+        """Archived messages in date order, optionally limited to YYYY-MM-DD bounds (for exports)"""
+        for path in self._segment_files():
+            date = os.path.basename(path)[len('messages-'):-len('.jsonl.gz')]
+            if (start_date and date < start_date) or (end_date and date > end_date):
+                continue
+            seen = set()
+            for row in self._read_segment(path):
+                if row['id'] not in seen:
+                    seen.add(row['id'])
+                    yield row
+
+    @staticmethod
+    def _read_segment(path: str) -> Iterator[dict]:
+        with gzip.open(path, 'rt', encoding='utf-8') as segment:
+            for line in segment:
+                if line.strip():
+                    yield json.loads(line)
+
+    def _read_user_messages(self, user_id: int, before_id: int, limit: int, segments: List[str]) -> List[dict]:
+        found: Dict[int, dict] = {}
+        for date in segments:
+            path = self._segment_path(date)
+            if not os.path.exists(path):
+                logger.warning(f"Archive segment {path} is indexed but missing")
+                continue
+            for row in self._read_segment(path):
+                if row['user_id'] == user_id and (not before_id or row['id'] < before_id):
+                    found[row['id']] = row
+            # Segments come newest first and hold older ids, so a full page from newer segments is final
+            if len(found) >= limit:
+                break
+        return sorted(found.values(), key=lambda row: row['id'], reverse=True)[:limit]
+
+    async def read_user_messages(self, user_id: int, before_id: int = 0, limit: int = 10) -> List[dict]:
+        """A user's archived messages, newest first, older than before_id (0 = from the newest).
+
+        Only the segments archived_ranges lists for the user are opened.
+        """
+        segments = await db_manager.get_archived_segments(user_id, before_id)
+        if not segments:
+            return []
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, self._read_user_messages, user_id, before_id, limit, segments)
+        except Exception as e:
+            logger.error(f"Error reading archived messages of user {user_id}: {e}")
+            return []
+
+# Global message archiver instance
+message_archiver = MessageArchiver()
@@ -1,6 +1,18 @@
 from enum import Enum, auto
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Set, Tuple
+import heapq
 import logging
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+# Seconds of inactivity after which a user's state and state data are dropped
+STATE_TTL = float(os.getenv('STATE_TTL', 3600))
+# Unanswered send confirmations go stale sooner
+STATE_CONFIRMATION_TTL = float(os.getenv('STATE_CONFIRMATION_TTL', 600))
 
 logger = logging.getLogger(__name__)
 
@@ -16,37 +28,95 @@ class BotState(Enum):
     UNBLOCKING_USER = auto()         # Unblocking user
 
 class StateManager:
-    """Manages bot states and transitions"""
+    """Manages bot states and transitions.
+
+    Every user entry (state and state data) expires after a period of
+    inactivity; deadlines sit in a min-heap so expiry costs O(log n) per entry
+    and runs lazily on each call. A reverse index from state to user IDs makes
+    state queries proportional to the size of their result.
+    """
     
-    def __init__(self):
+    def __init__(self, default_ttl: float = STATE_TTL, state_ttls: Optional[Dict[BotState, float]] = None):
         self._states: Dict[int, BotState] = {}
         self._state_data: Dict[int, Dict[str, Any]] = {}
+        self._users_by_state: Dict[BotState, Set[int]] = {}
+        self._default_ttl = default_ttl
+        self._state_ttls = state_ttls if state_ttls is not None else {
+            BotState.WAITING_FOR_CONFIRMATION: STATE_CONFIRMATION_TTL
+        }
+        self._expires_at: Dict[int, float] = {}
+        # (deadline, user_id); entries superseded by a later touch are skipped when popped
+        self._expiry_heap: List[Tuple[float, int]] = []
+        self.expired = 0
+    
+    def _touch(self, user_id: int):
+        """Restart the user's inactivity timer with the TTL of their current state"""
+        ttl = self._state_ttls.get(self._states.get(user_id, BotState.IDLE), self._default_ttl)
+        deadline = time.monotonic() + ttl
+        self._expires_at[user_id] = deadline
+        heapq.heappush(self._expiry_heap, (deadline, user_id))
+        # Rebuild once superseded entries dominate, so the heap stays proportional to live users
+        if len(self._expiry_heap) > 2 * len(self._expires_at) + 64:
+            self._expiry_heap = [(deadline, user_id) for user_id, deadline in self._expires_at.items()]
+            heapq.heapify(self._expiry_heap)
+    
+    def _expire(self):
+        """Drop every entry whose deadline has passed"""
+        now = time.monotonic()
+        heap = self._expiry_heap
+        expired = 0
+        while heap and heap[0][0] <= now:
+            deadline, user_id = heapq.heappop(heap)
+            if self._expires_at.get(user_id) != deadline:
+                continue
+            self._remove(user_id)
+            expired += 1
+        if expired:
+            self.expired += expired
+            logger.info(f"Expired states for {expired} inactive users")
+    
+    def _remove(self, user_id: int):
+        state = self._states.pop(user_id, None)
+        if state is not None:
+            users = self._users_by_state[state]
+            users.discard(user_id)
+            if not users:
+                del self._users_by_state[state]
+        self._state_data.pop(user_id, None)
+        self._expires_at.pop(user_id, None)
     
     def get_state(self, user_id: int) -> BotState:
         """Get current state for user"""
+        self._expire()
         return self._states.get(user_id, BotState.IDLE)
     
     def set_state(self, user_id: int, state: BotState, data: Optional[Dict[str, Any]] = None):
         """Set state for user with optional data"""
         old_state = self.get_state(user_id)
+        if user_id in self._states:
+            self._users_by_state[old_state].discard(user_id)
+            if not self._users_by_state[old_state]:
+                del self._users_by_state[old_state]
         self._states[user_id] = state
+        self._users_by_state.setdefault(state, set()).add(user_id)
         
         if data:
             if user_id not in self._state_data:
                 self._state_data[user_id] = {}
             self._state_data[user_id].update(data)
+        self._touch(user_id)
         
         logger.info(f"User {user_id} state changed: {old_state.name} -> {state.name}")
     
     def clear_state(self, user_id: int):
         """Clear state and data for user"""
         old_state = self.get_state(user_id)
-        self._states.pop(user_id, None)
-        self._state_data.pop(user_id, None)
+        self._remove(user_id)
         logger.info(f"User {user_id} state cleared from {old_state.name}")
     
     def get_state_data(self, user_id: int, key: str = None) -> Any:
         """Get state data for user"""
+        self._expire()
         user_data = self._state_data.get(user_id, {})
         if key:
             return user_data.get(key)
@@ -54,14 +124,21 @@ class StateManager:
     
     def set_state_data(self, user_id: int, key: str, value: Any):
         """Set specific state data for user"""
+        self._expire()
         if user_id not in self._state_data:
             self._state_data[user_id] = {}
         self._state_data[user_id][key] = value
+        self._touch(user_id)
     
     def remove_state_data(self, user_id: int, key: str):
         """Remove specific state data for user"""
+        self._expire()
         if user_id in self._state_data and key in self._state_data[user_id]:
             del self._state_data[user_id][key]
+            if not self._state_data[user_id]:
+                del self._state_data[user_id]
+                if user_id not in self._states:
+                    self._expires_at.pop(user_id, None)
     
     def is_in_state(self, user_id: int, state: BotState) -> bool:
         """Check if user is in specific state"""
@@ -126,16 +203,40 @@ class StateManager:
     
     def get_all_users_in_state(self, state: BotState) -> list:
         """Get all users currently in specific state"""
-        return [user_id for user_id, user_state in self._states.items() if user_state == state]
+        self._expire()
+        return list(self._users_by_state.get(state, ()))
+    
+    def count_users_in_state(self, state: BotState) -> int:
+        """Number of users currently in specific state"""
+        self._expire()
+        return len(self._users_by_state.get(state, ()))
     
     def cleanup_inactive_states(self, active_users: set):
-        """Clean up states for inactive users"""
+        """Clean up states for inactive users (entries also expire on their own after their TTL)"""
+        self._expire()
         inactive_users = set(self._states.keys()) - active_users
         for user_id in inactive_users:
             self.clear_state(user_id)
         
         if inactive_users:
             logger.info(f"Cleaned up states for {len(inactive_users)} inactive users")
+    
+    def memory_stats(self) -> Dict[str, int]:
+        """Entry counts and an approximate size of the bookkeeping structures in bytes"""
+        self._expire()
+        containers = (self._states, self._state_data, self._users_by_state,
+                      self._expires_at, self._expiry_heap)
+        approx_bytes = sum(sys.getsizeof(container) for container in containers)
+        approx_bytes += sum(sys.getsizeof(users) for users in self._users_by_state.values())
+        approx_bytes += sum(sys.getsizeof(data) for data in self._state_data.values())
+        return {
+            'users': len(self._expires_at),
+            'states': len(self._states),
+            'data_entries': sum(len(data) for data in self._state_data.values()),
+            'heap_entries': len(self._expiry_heap),
+            'expired': self.expired,
+            'approx_bytes': approx_bytes
+        }
 
 # Global state manager instance
 state_manager = StateManager()
\ No newline at end of file
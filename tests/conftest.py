@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Keep the module-level db_manager (created on import) away from the real database
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='anonymous-bot-tests-'), 'bot.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
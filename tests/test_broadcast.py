@@ -0,0 +1,33 @@
+import asyncio
+
+from handlers.broadcast import BroadcastEngine
+
+
+class AlbumBot:
+    def __init__(self):
+        self.copies = []
+
+    async def copy_messages(self, chat_id, from_chat_id, message_ids):
+        self.copies.append((chat_id, len(message_ids)))
+
+
+def test_album_broadcast_charges_one_token_per_item():
+    bot = AlbumBot()
+    engine = BroadcastEngine(rate=8)
+    acquired = []
+    acquire = engine._limiter.acquire
+
+    async def recording_acquire(tokens=1):
+        acquired.append(tokens)
+        await acquire(tokens)
+
+    engine._limiter.acquire = recording_acquire
+    job = {'source_chat_id': 1, 'source_message_ids': list(range(10)), 'text': None}
+
+    async def run():
+        return [await engine._send(bot, user_id, job, {}) for user_id in (101, 102)]
+
+    assert asyncio.run(run()) == [True, True]
+    assert bot.copies == [(101, 10), (102, 10)]
+    assert sum(acquired) == 20
+    assert max(acquired) <= 8
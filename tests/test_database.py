@@ -0,0 +1,45 @@
+import asyncio
+import sqlite3
+
+from database import DatabaseManager
+from migrations import MIGRATIONS, recount_stats, run_migrations
+
+
+def test_blocking_a_user_without_a_row_persists(tmp_path):
+    path = str(tmp_path / 'bot.db')
+
+    async def block():
+        db = DatabaseManager(path)
+        # A flooding sender who never ran /start: only their profile is cached
+        db.remember_user(42, 'flooder', 'Flo', None)
+        blocked = await db.block_user(42)
+        await db.close()
+        return blocked
+
+    async def reopen():
+        db = DatabaseManager(path)
+        page = await db.get_users_page(blocked_only=True)
+        totals = await db.get_user_totals()
+        unblocked = await db.unblock_user(42)
+        state = db.is_blocked(42)
+        await db.close()
+        return page, totals, unblocked, state
+
+    assert asyncio.run(block())
+    page, totals, unblocked, state = asyncio.run(reopen())
+    assert [(row[0], row[1]) for row in page] == [(42, 'flooder')]
+    assert totals['blocked_users'] == 1
+    assert unblocked and not state
+
+
+def test_upgrade_from_first_schema_counts_existing_rows():
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    MIGRATIONS[0][1](conn)
+    conn.execute('PRAGMA user_version = 1')
+    conn.executemany('INSERT INTO users (user_id, join_date, is_blocked) VALUES (?, ?, ?)',
+                     [(user_id, '2024-01-01', user_id % 2) for user_id in range(10)])
+    run_migrations(conn)
+    conn.execute("UPDATE users SET delivery_status = 'blocked_bot' WHERE user_id = 2")
+    recount_stats(conn)
+    row = conn.execute('SELECT total_users, blocked_users, unreachable_users FROM stats_counters').fetchone()
+    assert row == (10, 5, 1)
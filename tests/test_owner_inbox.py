@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from handlers import owner_inbox as owner_inbox_module
+from handlers.owner_inbox import OwnerInbox
+
+
+async def deliver_and_wait(inbox, *steps):
+    done = asyncio.get_running_loop().create_future()
+
+    async def on_done(delivered):
+        done.set_result(delivered)
+
+    inbox.deliver(object(), *steps, on_done=on_done)
+    return await done
+
+
+def test_flood_control_does_not_repeat_finished_steps():
+    calls = []
+
+    async def send_album():
+        calls.append('album')
+
+    async def send_header():
+        calls.append('header')
+        if calls.count('header') == 1:
+            raise RetryAfter(0)
+
+    async def run():
+        inbox = OwnerInbox(rate=1000, burst=10)
+        delivered = await deliver_and_wait(inbox, (send_album, 3), (send_header, 1))
+        await inbox.shutdown()
+        return delivered
+
+    assert asyncio.run(run())
+    assert calls == ['album', 'header', 'header']
+
+
+def test_failed_step_cancels_the_rest():
+    calls = []
+
+    async def send_album():
+        calls.append('album')
+        raise ValueError('bad request')
+
+    async def send_header():
+        calls.append('header')
+
+    async def run():
+        inbox = OwnerInbox(rate=1000, burst=10)
+        delivered = await deliver_and_wait(inbox, (send_album, 3), (send_header, 1))
+        await inbox.shutdown()
+        return delivered
+
+    assert asyncio.run(run()) is False
+    assert calls == ['album']
+
+
+def test_sends_larger_than_the_bucket_pay_their_full_cost():
+    async def send():
+        pass
+
+    async def run():
+        inbox = OwnerInbox(rate=100, burst=2)
+        start = time.monotonic()
+        # 2 tokens are in the bucket; the other 10 refill at 100 per second
+        await deliver_and_wait(inbox, (send, 12))
+        elapsed = time.monotonic() - start
+        await inbox.shutdown()
+        return elapsed
+
+    assert asyncio.run(run()) >= 0.09
+
+
+class FlakyBot:
+    def __init__(self, failures):
+        self.failures = failures
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('network down')
+        self.sent.append(text)
+
+
+def test_failed_digest_is_retried(monkeypatch):
+    monkeypatch.setattr(owner_inbox_module, 'OWNER_RETRY_DELAY', 0)
+    bot = FlakyBot(failures=2)
+
+    async def run():
+        inbox = OwnerInbox(rate=1000, burst=10)
+        for user_id in (1, 2, 3):
+            inbox.deliver_text(bot, user_id, f'user {user_id}', f'hello from {user_id}')
+        await inbox.shutdown()
+
+    asyncio.run(run())
+    assert len(bot.sent) == 1
+    assert all(f'hello from {user_id}' in bot.sent[0] for user_id in (1, 2, 3))
+
+
+def test_texts_behind_media_do_not_make_a_digest():
+    bot = FlakyBot(failures=0)
+
+    async def send_media():
+        bot.sent.append('media')
+
+    async def run():
+        inbox = OwnerInbox(rate=1000, burst=10)
+        inbox.deliver_text(bot, 1, 'user 1', 'before media')
+        inbox.deliver(bot, (send_media, 1))
+        inbox.deliver_text(bot, 2, 'user 2', 'after media')
+        inbox.deliver_text(bot, 3, 'user 3', 'also after media')
+        await inbox.shutdown()
+
+    asyncio.run(run())
+    assert bot.sent == ['user 1\n\nbefore media', 'media', 'user 2\n\nafter media', 'user 3\n\nalso after media']
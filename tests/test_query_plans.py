@@ -0,0 +1,100 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from database import DatabaseManager
+from migrations import run_migrations
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """Migrated database with enough rows that the planner has real choices to make"""
+    conn = sqlite3.connect(tmp_path / 'plans.db', isolation_level=None)
+    run_migrations(conn)
+    conn.execute('BEGIN')
+    conn.executemany(
+        'INSERT INTO users (user_id, username, join_date, is_blocked) VALUES (?, ?, ?, ?)',
+        [(i, f'user{i}', f'2024-01-{i % 28 + 1:02d}', int(i % 10 == 0)) for i in range(1, 2001)]
+    )
+    conn.executemany(
+        'INSERT INTO messages (user_id, message, timestamp) VALUES (?, ?, ?)',
+        [(i % 200, f'message {i}', '2024-01-01T00:00:00') for i in range(5000)]
+    )
+    conn.execute('COMMIT')
+    conn.execute('ANALYZE')
+    yield conn
+    conn.close()
+
+
+def query_plan(conn, sql, params=()):
+    return ' | '.join(row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params))
+
+
+def test_username_lookup_uses_index(conn):
+    plan = query_plan(conn, 'SELECT user_id FROM users WHERE username = ?', ('user5',))
+    assert 'USING INDEX idx_users_username' in plan or 'USING COVERING INDEX idx_users_username' in plan
+
+
+def test_block_list_uses_blocked_join_date_index(conn):
+    plan = query_plan(conn, '''
+        SELECT user_id, username, first_name, last_name
+        FROM users WHERE is_blocked = 1 AND user_id != ?
+        ORDER BY join_date DESC
+    ''', (0,))
+    assert 'idx_users_blocked_join_date' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_user_messages_use_user_id_index(conn):
+    plan = query_plan(conn, '''
+        SELECT id, message, timestamp FROM messages
+        WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?
+    ''', (5, 1000, 10))
+    assert 'idx_messages_user_id' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+@pytest.fixture
+def traced(conn, tmp_path):
+    """DatabaseManager on the same file whose reader connection records every statement it runs"""
+    # The bot never runs ANALYZE, so plan the way a production database would: without statistics
+    conn.execute('DROP TABLE sqlite_stat1')
+    db = DatabaseManager(str(tmp_path / 'plans.db'), reader_threads=1)
+    unanalyzed = sqlite3.connect(tmp_path / 'plans.db')
+    statements = []
+    db._readers.submit(db._call, True, lambda c: None, ()).result()
+    for connection in db._connections:
+        connection.set_trace_callback(statements.append)
+    yield db, unanalyzed, statements
+    unanalyzed.close()
+    asyncio.run(db.close())
+
+
+def select_plans(conn, statements):
+    return [query_plan(conn, sql) for sql in statements if sql.lstrip().upper().startswith('SELECT')]
+
+
+def test_active_user_batches_walk_primary_key(traced):
+    db, conn, statements = traced
+
+    async def collect():
+        return [batch async for batch in db.iter_active_user_ids(after_user_id=500, batch_size=100)]
+
+    batches = asyncio.run(collect())
+    assert batches and batches[0][0] > 500
+    plans = select_plans(conn, statements)
+    assert plans
+    for plan in plans:
+        assert 'USING INTEGER PRIMARY KEY (rowid>?)' in plan
+        assert 'TEMP B-TREE' not in plan
+
+
+def test_active_users_walk_primary_key(traced):
+    db, conn, statements = traced
+    assert asyncio.run(db.get_active_users())
+    plans = select_plans(conn, statements)
+    assert plans
+    for plan in plans:
+        assert 'idx_users_blocked_join_date' not in plan
+        assert 'TEMP B-TREE' not in plan
@@ -0,0 +1,35 @@
+import asyncio
+import sqlite3
+
+from database import db_manager
+from retention import MessageArchiver
+
+
+def test_history_reads_only_the_users_segments(tmp_path):
+    conn = sqlite3.connect(db_manager.db_path, isolation_level=None)
+    conn.executemany(
+        'INSERT INTO messages (user_id, message, timestamp) VALUES (?, ?, ?)',
+        [(1 if day == 3 else 2, f'day {day} message {i}', f'2020-01-{day:02d}T12:00:00')
+         for day in range(1, 6) for i in range(4)]
+    )
+    conn.close()
+    archiver = MessageArchiver(str(tmp_path), retention_days=30)
+    opened = []
+    read_segment = archiver._read_segment
+
+    def recording_read(path):
+        opened.append(path)
+        return read_segment(path)
+
+    async def run():
+        assert await archiver.archive_expired() == 20
+        archiver._read_segment = recording_read
+        newest = await archiver.read_user_messages(1, limit=3)
+        older = await archiver.read_user_messages(1, newest[-1]['id'], limit=3)
+        return newest, older
+
+    newest, older = asyncio.run(run())
+    assert len(list(tmp_path.iterdir())) == 5
+    assert [row['message'] for row in newest] == ['day 3 message 3', 'day 3 message 2', 'day 3 message 1']
+    assert [row['message'] for row in older] == ['day 3 message 0']
+    assert opened == [archiver._segment_path('2020-01-03')] * 2
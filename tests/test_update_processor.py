@@ -0,0 +1,39 @@
+import asyncio
+
+from telegram import Update, User, Message, Chat
+
+from update_processor import PerUserUpdateProcessor
+
+
+def user_update(update_id, user_id):
+    user = User(user_id, f'User {user_id}', False)
+    message = Message(update_id, None, Chat(user_id, 'private'), from_user=user)
+    return Update(update_id, message=message)
+
+
+def test_user_order_and_concurrency_limit():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+    running = []
+    peak = []
+    order = {1: [], 2: [], 3: []}
+
+    async def handle(update_id, user_id):
+        running.append(update_id)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        order[user_id].append(update_id)
+        running.remove(update_id)
+
+    async def run():
+        updates = [(number, number % 3 + 1) for number in range(30)]
+        await asyncio.gather(*(
+            processor.process_update(user_update(number, user_id), handle(number, user_id))
+            for number, user_id in updates
+        ))
+
+    asyncio.run(run())
+    assert max(peak) == 2
+    for user_id, handled in order.items():
+        assert handled == sorted(handled)
+        assert len(handled) == 10
+    assert processor.queue_depths() == {}
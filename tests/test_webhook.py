@@ -0,0 +1,113 @@
+import asyncio
+import json
+import socket
+import statistics
+import time
+
+import httpx
+from telegram.request import BaseRequest
+
+from main import WEBHOOK_PATH, build_application
+
+SECRET = 'test-webhook-secret'
+UPDATES = 50
+
+
+class FakeBotApi(BaseRequest):
+    """Answers Bot API calls locally and records when each reply is sent"""
+
+    def __init__(self):
+        self.sent = {}
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if endpoint == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Test', 'username': 'test_bot'}
+        elif endpoint == 'getChatMember':
+            result = {'status': 'member', 'user': {'id': params['user_id'], 'is_bot': False, 'first_name': 'U'}}
+        elif endpoint == 'sendMessage':
+            self.sent[params['chat_id']] = time.monotonic()
+            result = {'message_id': len(self.sent), 'date': int(time.time()), 'text': params['text'],
+                      'chat': {'id': params['chat_id'], 'type': 'private'}}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def start_update(number):
+    user = {'id': 10000 + number, 'is_bot': False, 'first_name': f'User {number}'}
+    return {
+        'update_id': number,
+        'message': {
+            'message_id': number, 'date': int(time.time()), 'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+            'from': user, 'chat': {'id': user['id'], 'type': 'private'}
+        }
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_webhook_checks_secret_and_handles_updates():
+    bot_api = FakeBotApi()
+    port = free_port()
+    url = f'http://127.0.0.1:{port}/{WEBHOOK_PATH}'
+
+    async def run():
+        application = build_application('123:TEST', bot_api)
+        await application.initialize()
+        await application.start()
+        await application.updater.start_webhook(
+            listen='127.0.0.1', port=port, url_path=WEBHOOK_PATH, webhook_url=url, secret_token=SECRET
+        )
+        try:
+            async with httpx.AsyncClient() as client:
+                missing = await client.post(url, json=start_update(0))
+                wrong = await client.post(url, json=start_update(0),
+                                          headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'})
+                await asyncio.sleep(0.2)
+                rejected_handled = bool(bot_api.sent)
+
+                posted = {}
+                for number in range(1, UPDATES + 1):
+                    posted[10000 + number] = time.monotonic()
+                    response = await client.post(url, json=start_update(number),
+                                                 headers={'X-Telegram-Bot-Api-Secret-Token': SECRET})
+                    assert response.status_code == 200
+                for _ in range(100):
+                    if len(bot_api.sent) == UPDATES:
+                        break
+                    await asyncio.sleep(0.05)
+        finally:
+            await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
+        return missing.status_code, wrong.status_code, rejected_handled, posted
+
+    missing, wrong, rejected_handled, posted = asyncio.run(run())
+    assert missing == 403
+    assert wrong == 403
+    assert not rejected_handled
+    assert set(bot_api.sent) == set(posted)
+
+    latencies = sorted((bot_api.sent[user_id] - posted[user_id]) * 1000 for user_id in posted)
+    median = statistics.median(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"\nWebhook update to reply over {UPDATES} updates: median {median:.1f} ms, p95 {p95:.1f} ms")
+    assert p95 < 1000
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Dict, Optional
+from dotenv import load_dotenv
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Load environment variables
+load_dotenv()
+# Updates processed at the same time across all users
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', 16))
+# Updates allowed to wait for their user's turn at the same time (PTB's own semaphore)
+UPDATE_MAX_WAITING = int(os.getenv('UPDATE_MAX_WAITING', 1000))
+# Log a warning when a single user has this many updates waiting
+USER_QUEUE_WARN_DEPTH = int(os.getenv('USER_QUEUE_WARN_DEPTH', 20))
+
+logger = logging.getLogger(__name__)
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates from different users in parallel and each user's updates in order.
+
+    Every user has a FIFO lock that is taken before the global concurrency
+    slot, so a user's queued updates never occupy slots other users could
+    use, and flows relying on context.user_data see their updates in order.
+    """
+
+    def __init__(self, max_concurrent_updates: int = UPDATE_CONCURRENCY,
+                 max_waiting_updates: int = UPDATE_MAX_WAITING):
+        # PTB's process_update (final) takes the base class semaphore before calling
+        # do_process_update, so that semaphore only bounds updates waiting for their user's
+        # lock. The real concurrency limit is _slots, taken in do_process_update after the lock.
+        super().__init__(max_waiting_updates)
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._pending: Dict[int, int] = {}
+
+    @staticmethod
+    def _ordering_key(update: object) -> Optional[int]:
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._ordering_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        depth = self._pending[key] = self._pending.get(key, 0) + 1
+        if depth >= USER_QUEUE_WARN_DEPTH:
+            logger.warning(f"User {key} has {depth} updates queued")
+
+        try:
+            async with lock, self._slots:
+                await coroutine
+        finally:
+            self._pending[key] -= 1
+            if not self._pending[key]:
+                del self._pending[key]
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def queue_depths(self) -> Dict[int, int]:
+        """Number of updates queued or running per user"""
+        return dict(self._pending)